@@ -0,0 +1,242 @@
+# Benchmark suite for Galactic Star Collector
+#
+# Drives scripted scenarios through every entry in LEVEL_CONFIGS and
+# reports per-frame update and render cost (mean, p95, p99 in ms). Runs under
+# the SDL dummy video driver, so no window is needed. Results can be saved as
+# a JSON baseline and later runs compared against it.
+#
+#   python benchmark.py --save baseline.json
+#   python benchmark.py --compare baseline.json
+import os
+os.environ.setdefault("SDL_VIDEODRIVER", "dummy")
+os.environ.setdefault("SDL_AUDIODRIVER", "dummy")
+os.environ.setdefault("PYGAME_HIDE_SUPPORT_PROMPT", "1")
+
+import sys
+import json
+import random
+import time
+import fnmatch
+import platform
+import argparse
+import numpy as np
+import pygame
+import starcollector as sc
+
+STRESS_SCALES = (5, 20, 50)
+ENDLESS_WAVES = (20, 40, 50)  # wave 50 holds about 6,000 stars, enemies and bullets
+ENDLESS_FILL_TICKS = 2400  # unmeasured ticks for the slow stars to fill the screen
+EXPLOSION_INTERVAL = 10  # frames between burst waves in the explosion scenario
+EXPLOSION_WAVE = 4       # bursts per wave
+NOISE_FLOOR_MS = 0.05    # smaller differences are never reported as regressions
+
+def hold_level(game):
+    # Keep a scenario on its level: no game over, no level change and the
+    # star groups keep coming
+    game.state = "playing"
+    game.player.missed_stars = 0
+    game.player.collected_stars = min(game.player.collected_stars, game.stars_to_generate - 1)
+    game.stars_generated = 0
+    game.level_change_timer = 0
+
+def make_game(level, seed, scale=1):
+    # Planets are placed with the module generator, seed it too so every
+    # run draws the same layout
+    random.seed(seed)
+    game = sc.Game(seed)
+    game.reset_game(seed)
+    if scale != 1:
+        config = dict(game.level_configs[level - 1])
+        config["enemy_count"] *= scale
+        low, high = config["star_group_size"]
+        config["star_group_size"] = (low * scale, high * scale)
+        config["spawn_chance"] = min(1.0, config["spawn_chance"] * scale)
+        game.level_configs[level - 1] = config
+    game.level = level
+    game.generate_stars()
+    game.generate_enemies()
+    game.generate_planets()
+    return game
+
+# Scenario setups take a fresh game and return the per-frame input hook
+def steady(game):
+    def hook(game, frame):
+        hold_level(game)
+        return sc.seek_script(game, frame)
+    return hook
+
+def explosions(game):
+    rng = np.random.default_rng(0)
+    def hook(game, frame):
+        hold_level(game)
+        if frame % EXPLOSION_INTERVAL == 0:
+            for _ in range(EXPLOSION_WAVE):
+                game.particles.emit_burst(rng.uniform(50, sc.WIDTH - 50), rng.uniform(50, sc.HEIGHT - 50))
+        return sc.seek_script(game, frame)
+    return hook
+
+def endless(wave):
+    def setup(game):
+        game.reset_game(game.seed, mode="endless")
+        game.endless.ticks = (wave - 1) * sc.ENDLESS_WAVE_TICKS
+        for _ in range(ENDLESS_FILL_TICKS):
+            game.state = "playing"
+            game.step(sc.INPUT_SHOOT)
+        return steady(game)
+    return setup
+
+def menu(game):
+    game.state = "menu"
+    return sc.idle_script
+
+def game_over(game):
+    game.state = "game_over"
+    game.player.score = 1230
+    return sc.idle_script
+
+def scenarios(levels):
+    for level in levels:
+        yield f"level{level:02d}/steady", level, 1, steady
+        yield f"level{level:02d}/explosions", level, 1, explosions
+    yield "menu", 1, 1, menu
+    yield "game_over", 1, 1, game_over
+    for scale in STRESS_SCALES:
+        yield f"stress/level{max(levels):02d}x{scale}", max(levels), scale, steady
+    for wave in ENDLESS_WAVES:
+        yield f"endless/wave{wave}", 1, 1, endless(wave)
+
+def summarize(samples):
+    ms = np.asarray(samples) * 1000.0
+    return {
+        "mean": float(ms.mean()),
+        "p95": float(np.percentile(ms, 95)),
+        "p99": float(np.percentile(ms, 99)),
+    }
+
+def run_scenario(target, level, scale, setup, frames, warmup, seed, renderer=None, quality=0):
+    game = make_game(level, seed, scale)
+    game.set_quality(quality)
+    hook = setup(game)
+    update_times = []
+    render_times = []
+    clock = time.perf_counter
+    for frame in range(warmup + frames):
+        mask = hook(game, frame)
+
+        start = clock()
+        game.step(mask)
+        updated = clock()
+        # Rendering includes scaling the frame up to the window
+        if renderer is not None:
+            rects = target.present(renderer.draw(game, target.surface))
+        else:
+            game.draw(target.surface)
+            rects = target.present()
+        if rects is None:
+            pygame.display.flip()
+        elif rects:
+            pygame.display.update(rects)
+        rendered = clock()
+
+        if frame >= warmup:
+            update_times.append(updated - start)
+            render_times.append(rendered - updated)
+    return {
+        "update": summarize(update_times),
+        "render": summarize(render_times),
+        "entities": len(game.stars) + len(game.enemies) + game.particles.count + game.endless.entity_count(),
+    }
+
+def compare(results, baseline, tolerance):
+    # Scenario/metric pairs that got slower than the baseline allows
+    regressions = []
+    for name, result in results.items():
+        old = baseline["results"].get(name)
+        if old is None:
+            continue
+        for phase in ("update", "render"):
+            for stat in ("mean", "p95"):
+                before = old[phase][stat]
+                after = result[phase][stat]
+                if after > before * (1 + tolerance) and after - before > NOISE_FLOOR_MS:
+                    regressions.append((name, phase, stat, before, after))
+    return regressions
+
+def parse_args(argv=None):
+    parser = argparse.ArgumentParser(description="Star Collector update/render benchmarks")
+    parser.add_argument("--frames", type=int, default=300, help="measured frames per scenario")
+    parser.add_argument("--warmup", type=int, default=60, help="unmeasured frames per scenario")
+    parser.add_argument("--levels", type=int, nargs="+", help="levels to run (default: all)")
+    parser.add_argument("--only", metavar="PATTERN", help="run scenarios matching a glob, e.g. 'stress/*'")
+    parser.add_argument("--seed", type=int, default=1234)
+    parser.add_argument("--dirty-rects", action="store_true", help="render with DirtyRenderer")
+    parser.add_argument("--quality", choices=[tier["name"] for tier in sc.QUALITY_TIERS], default="high",
+                        help="visual quality tier to render with")
+    parser.add_argument("--render-scale", type=sc.parse_render_scale, default=1.0,
+                        help="render at this fraction of the window resolution, e.g. 0.5")
+    parser.add_argument("--save", metavar="FILE", help="write results as a JSON baseline")
+    parser.add_argument("--compare", metavar="FILE", help="flag regressions against a JSON baseline")
+    parser.add_argument("--tolerance", type=float, default=0.15,
+                        help="allowed slowdown before a regression is flagged (0.15 = 15%%)")
+    return parser.parse_args(argv)
+
+def main(argv=None):
+    args = parse_args(argv)
+    target = sc.RenderTarget(sc.init_display(), args.render_scale)
+    levels = args.levels or list(range(1, len(sc.LEVEL_CONFIGS) + 1))
+
+    results = {}
+    print(f"{'scenario':<22}{'update mean':>12}{'p95':>8}{'p99':>8}{'render mean':>13}{'p95':>8}{'p99':>8}{'entities':>10}")
+    for name, level, scale, setup in scenarios(levels):
+        if args.only and not fnmatch.fnmatch(name, args.only):
+            continue
+        renderer = sc.DirtyRenderer() if args.dirty_rects else None
+        quality = [tier["name"] for tier in sc.QUALITY_TIERS].index(args.quality)
+        result = run_scenario(target, level, scale, setup, args.frames, args.warmup, args.seed, renderer, quality)
+        results[name] = result
+        update, render = result["update"], result["render"]
+        print(f"{name:<22}{update['mean']:>12.3f}{update['p95']:>8.3f}{update['p99']:>8.3f}"
+              f"{render['mean']:>13.3f}{render['p95']:>8.3f}{render['p99']:>8.3f}{result['entities']:>10}")
+
+    report = {
+        "meta": {
+            "python": platform.python_version(),
+            "pygame": pygame.version.ver,
+            "platform": platform.platform(),
+            "frames": args.frames,
+            "warmup": args.warmup,
+            "seed": args.seed,
+            "renderer": "dirty-rects" if args.dirty_rects else "full",
+            "quality": args.quality,
+            "render_scale": args.render_scale,
+        },
+        "results": results,
+    }
+    if args.save:
+        with open(args.save, "w") as f:
+            json.dump(report, f, indent=2)
+        print(f"saved baseline to {args.save}")
+
+    status = 0
+    if args.compare:
+        with open(args.compare) as f:
+            baseline = json.load(f)
+        if baseline["meta"].get("renderer") != report["meta"]["renderer"]:
+            print(f"warning: baseline was recorded with the {baseline['meta'].get('renderer')} renderer")
+        # Baselines from before quality tiers and render scales drew like high at 1.0
+        if baseline["meta"].get("quality", "high") != args.quality:
+            print(f"warning: baseline was recorded at {baseline['meta'].get('quality', 'high')} quality")
+        if baseline["meta"].get("render_scale", 1.0) != args.render_scale:
+            print(f"warning: baseline was recorded at render scale {baseline['meta'].get('render_scale', 1.0)}")
+        regressions = compare(results, baseline, args.tolerance)
+        for name, phase, stat, before, after in regressions:
+            print(f"REGRESSION {name} {phase} {stat}: {before:.3f} ms -> {after:.3f} ms")
+        if regressions:
+            status = 1
+        else:
+            print(f"no regressions against {args.compare}")
+    pygame.quit()
+    return status
+
+if __name__ == "__main__":
+    sys.exit(main())
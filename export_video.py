@@ -0,0 +1,158 @@
+# Offscreen video export for recorded sessions
+#
+# Re-simulates a replay, draws every frame into an offscreen surface and hands
+# the raw pixels to a pool of worker processes that encode them. Output is a
+# PNG sequence or a YUV4MPEG2 (.y4m) stream, which ffmpeg and most players
+# read directly. Runs under the SDL dummy video driver, so no window is needed.
+#
+#   python export_video.py session.rep clip.y4m
+#   python export_video.py session.rep frames/frame_%05d.png --fps 30
+#   ffmpeg -i clip.y4m clip.mp4
+import os
+os.environ.setdefault("SDL_VIDEODRIVER", "dummy")
+os.environ.setdefault("SDL_AUDIODRIVER", "dummy")
+os.environ.setdefault("PYGAME_HIDE_SUPPORT_PROMPT", "1")
+
+import sys
+import time
+import zlib
+import struct
+import random
+import argparse
+import multiprocessing
+from collections import deque
+import numpy as np
+import pygame
+import starcollector as sc
+
+FRAMES_IN_FLIGHT = 4  # encoded frames queued per worker before rendering waits
+PNG_COMPRESSION = 1   # zlib level; 1 is about twice as fast as 6 for a 60% larger file
+
+def frame_path(pattern, number):
+    # frames/frame_%05d.png -> frames/frame_00012.png
+    return pattern % number
+
+def png_chunk(kind, body):
+    return struct.pack(">I", len(body)) + kind + body + struct.pack(">I", zlib.crc32(kind + body))
+
+def encode_png(data, size, path):
+    # 8-bit RGB, every row unfiltered. pygame.image.save compresses harder
+    # and takes about five times as long per frame.
+    width, height = size
+    rows = np.zeros((height, width * 3 + 1), np.uint8)
+    rows[:, 1:] = np.frombuffer(data, np.uint8).reshape(height, width * 3)
+    with open(path, "wb") as f:
+        f.write(b"\x89PNG\r\n\x1a\n")
+        f.write(png_chunk(b"IHDR", struct.pack(">IIBBBBB", width, height, 8, 2, 0, 0, 0)))
+        f.write(png_chunk(b"IDAT", zlib.compress(rows.tobytes(), PNG_COMPRESSION)))
+        f.write(png_chunk(b"IEND", b""))
+    return None
+
+def block_sums(plane):
+    # Sum of each 2x2 block, 0-1020
+    return (plane[0::2, 0::2] + plane[0::2, 1::2] + plane[1::2, 0::2] + plane[1::2, 1::2]).astype(np.int32)
+
+def encode_y4m(data, size):
+    # Full-range BT.601 4:2:0 in fixed point, chroma from each 2x2 block
+    width, height = size
+    rgb = np.frombuffer(data, np.uint8).reshape(height, width, 3)
+    r, g, b = (rgb[..., c].astype(np.uint16) for c in range(3))
+    y = (77 * r + 150 * g + 29 * b + 128) >> 8
+    r, g, b = block_sums(r), block_sums(g), block_sums(b)
+    u = (128 * 1024 - 43 * r - 85 * g + 128 * b + 512) >> 10
+    v = (128 * 1024 + 128 * r - 107 * g - 21 * b + 512) >> 10
+    planes = [np.clip(plane, 0, 255).astype(np.uint8).tobytes() for plane in (y, u, v)]
+    return b"FRAME\n" + b"".join(planes)
+
+def y4m_header(size, fps):
+    width, height = size
+    return f"YUV4MPEG2 W{width} H{height} F{fps}:1 Ip A1:1 C420jpeg\n".encode()
+
+def render_frames(replay, fps, limit=None):
+    # Yield the raw RGB bytes of every frame in the session. Each frame shows
+    # the last tick before its time, drawn with the tick clock so the
+    # background twinkles the same in every export.
+    screen = pygame.display.get_surface()
+    surface = pygame.Surface(screen.get_size(), 0, screen)
+    random.seed(replay.seed)  # planets use the module generator
+    game = sc.Game()
+    game.bullets_outlive_shooter = replay.bullets_outlive_shooter
+    game.reset_game(replay.seed, replay.mode)
+    ticks = 0
+    game.ticks_ms = lambda: ticks * 1000 // sc.FPS
+    frames = len(replay.masks) * fps // sc.FPS + 1
+    if limit is not None:
+        frames = min(frames, limit)
+    for frame in range(frames):
+        target = frame * sc.FPS // fps
+        while ticks < target:
+            game.step(replay.masks[ticks])
+            ticks += 1
+        game.draw(surface)
+        yield pygame.image.tobytes(surface, "RGB")
+
+def export(replay, output, fps=sc.FPS, workers=None, limit=None):
+    # Returns the number of frames written. Frames are rendered here and
+    # encoded in parallel; y4m output is written back in frame order.
+    size = (sc.WIDTH, sc.HEIGHT)
+    y4m = output.endswith(".y4m")
+    if not y4m and "%" not in output:
+        raise ValueError("PNG output needs a frame number pattern such as frames/frame_%05d.png")
+    if not y4m:
+        os.makedirs(os.path.dirname(output) or ".", exist_ok=True)
+    workers = workers or os.cpu_count() or 1
+
+    # Workers fork before the display exists and never touch it
+    pool = multiprocessing.Pool(workers)
+    video = open(output, "wb") if y4m else None
+    written = 0
+    try:
+        sc.init_display()
+        if video:
+            video.write(y4m_header(size, fps))
+        pending = deque()
+        for number, data in enumerate(render_frames(replay, fps, limit)):
+            if y4m:
+                pending.append(pool.apply_async(encode_y4m, (data, size)))
+            else:
+                pending.append(pool.apply_async(encode_png, (data, size, frame_path(output, number))))
+            while len(pending) >= workers * FRAMES_IN_FLIGHT:
+                encoded = pending.popleft().get()
+                if video:
+                    video.write(encoded)
+                written += 1
+        while pending:
+            encoded = pending.popleft().get()
+            if video:
+                video.write(encoded)
+            written += 1
+    finally:
+        if video:
+            video.close()
+        pool.close()
+        pool.join()
+    return written
+
+def parse_args(argv=None):
+    parser = argparse.ArgumentParser(description="Render a Star Collector replay to video offscreen")
+    parser.add_argument("replay", help="replay file recorded with --record")
+    parser.add_argument("output", help="a .y4m file, or a PNG pattern such as frames/frame_%%05d.png")
+    parser.add_argument("--fps", type=int, default=sc.FPS, help="video frame rate (default: the tick rate)")
+    parser.add_argument("--workers", type=int, help="encoder processes (default: one per core)")
+    parser.add_argument("--frames", type=int, help="stop after this many frames")
+    return parser.parse_args(argv)
+
+def main(argv=None):
+    args = parse_args(argv)
+    replay = sc.Replay.load(args.replay)
+    start = time.perf_counter()
+    frames = export(replay, args.output, args.fps, args.workers, args.frames)
+    elapsed = time.perf_counter() - start
+    pygame.quit()
+    length = frames / args.fps
+    print(f"frames: {frames}  video: {length:.1f}s  time: {elapsed:.2f}s  "
+          f"speed: {length / max(elapsed, 1e-9):.1f}x real time")
+    return 0
+
+if __name__ == "__main__":
+    sys.exit(main())
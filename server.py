@@ -0,0 +1,406 @@
+# Game server hosting many headless sessions in one asyncio event loop
+#
+# Every connection plays its own Game. One scheduler task steps all sessions
+# together each tick and then sends each client its state. Messages are
+# length-prefixed (FRAME) and start with a type byte:
+#
+#   client -> server  HELLO  mode, seed (-1 picks one)
+#                     INPUT  key bitmask (INPUT_*), last state tick received
+#                     RESET  start a new game
+#   server -> client  WELCOME  session id, ticks per second
+#                     STATE    tick, base tick, game and player fields, then
+#                              one entity block per ENTITY_KINDS entry
+#
+# Entities are int16 rows keyed by their index in each list. A STATE only
+# carries the rows that differ from the base tick, the last tick the client
+# acknowledged, each with a bitmask of its changed fields. A base tick of 0
+# means the message is complete on its own.
+#
+#   python server.py --port 7777
+#   python server.py --bots 200 --duration 10
+import os
+os.environ.setdefault("PYGAME_HIDE_SUPPORT_PROMPT", "1")
+
+import sys
+import time
+import random
+import asyncio
+import argparse
+from collections import deque
+import struct
+import numpy as np
+import starcollector as sc
+
+SEND_EVERY = 1            # ticks between state messages
+HISTORY_TICKS = 64        # sent states kept per session as delta bases
+WRITE_BUFFER_LIMIT = 256 * 1024  # skip a slow client's state until it drains
+STATS_INTERVAL = 5.0      # seconds between metric reports
+
+FRAME = struct.Struct("<I")       # payload length
+HELLO = struct.Struct("<BBq")     # type, mode, seed
+INPUT = struct.Struct("<BBI")     # type, key mask, acknowledged tick
+RESET = struct.Struct("<B")       # type
+WELCOME = struct.Struct("<BII")   # type, session id, ticks per second
+# type, tick, base tick, state, mode, level, score, player x, player y,
+# collected stars, missed stars, level change timer, stars to collect
+STATE = struct.Struct("<BIIBBHqhhHHhH")
+KIND = struct.Struct("<HH")       # entities, changed entities
+MSG_HELLO, MSG_INPUT, MSG_RESET = 1, 2, 3
+MSG_WELCOME, MSG_STATE = 1, 2
+# Client messages by type. Each has a fixed size, anything else drops the client.
+CLIENT_MESSAGES = {MSG_HELLO: HELLO, MSG_INPUT: INPUT, MSG_RESET: RESET}
+MAX_CLIENT_MESSAGE = max(message.size for message in CLIENT_MESSAGES.values())
+
+# Entity kinds in message order, with their fields
+ENTITY_KINDS = (
+    ("stars", ("x", "y", "size")),
+    ("enemies", ("x", "y", "alive", "hit")),
+    ("player_bullets", ("x", "y")),
+    ("enemy_bullets", ("x", "y")),
+    ("endless_stars", ("x", "y", "size")),
+    ("endless_enemies", ("x", "y")),
+    ("planets", ("x", "y", "level", "step")),
+)
+FIELD_BITS = 1 << np.arange(8, dtype=np.uint8)
+
+EMPTY_KIND = KIND.pack(0, 0)
+
+# Most kinds are empty most of the time (endless arrays in the level game and
+# the other way round), so empty tables skip NumPy entirely
+def rows(values, width):
+    if not values:
+        return np.empty((0, width), np.int16)
+    return np.array(values, np.int16)
+
+def columns(store, names):
+    n = store.count
+    if n == 0:
+        return np.empty((0, len(names)), np.int16)
+    return np.column_stack([getattr(store, name)[:n] for name in names]).astype(np.int16)
+
+def world_tables(game):
+    # One int16 table per ENTITY_KINDS entry
+    endless = game.endless
+    return (
+        rows([(star.x, star.y, star.size) for star in game.stars], 3),
+        rows([(enemy.x, enemy.y, enemy.alive, enemy.hit_timer > 0) for enemy in game.enemies], 4),
+        rows(list(game.player.bullets), 2),
+        columns(game.enemy_bullets, ("x", "y")),
+        columns(endless.stars, ("x", "y", "size")),
+        columns(endless.enemies, ("x", "y")),
+        rows([(planet.x, planet.y, planet.level, planet.rotation_step()) for planet in game.planets], 4),
+    )
+
+def encode_kind(table, base):
+    # Rows that are new or differ from base: indices, field masks and the
+    # changed values in row order
+    count = len(table)
+    if count == 0:
+        return EMPTY_KIND
+    diff = np.ones(table.shape, bool)
+    shared = min(count, len(base)) if base is not None else 0
+    if shared:
+        diff[:shared] = table[:shared] != base[:shared]
+    changed = np.flatnonzero(diff.any(axis=1))
+    bits = diff[changed]
+    masks = (bits * FIELD_BITS[:table.shape[1]]).sum(axis=1, dtype=np.uint8)
+    return b"".join((KIND.pack(count, len(changed)), changed.astype("<u2").tobytes(), masks.tobytes(),
+                     table[changed][bits].astype("<i2").tobytes()))
+
+def decode_kind(data, offset, base, width):
+    # The table encode_kind described, rebuilt on top of base
+    count, changed = KIND.unpack_from(data, offset)
+    offset += KIND.size
+    index = np.frombuffer(data, "<u2", changed, offset)
+    offset += index.nbytes
+    masks = np.frombuffer(data, np.uint8, changed, offset)
+    offset += masks.nbytes
+    bits = (masks[:, None] & FIELD_BITS[:width]) != 0
+    values = np.frombuffer(data, "<i2", int(bits.sum()), offset)
+    offset += values.nbytes
+    table = np.zeros((count, width), np.int16)
+    shared = min(count, len(base)) if base is not None else 0
+    if shared:
+        table[:shared] = base[:shared]
+    changed_rows = table[index]
+    changed_rows[bits] = values
+    table[index] = changed_rows
+    return table, offset
+
+def state_header(game, tick, base_tick):
+    player = game.player
+    return STATE.pack(MSG_STATE, tick, base_tick, sc.GAME_STATES.index(game.state), sc.GAME_MODES.index(game.mode),
+                      game.level, player.score, int(player.x), int(player.y), player.collected_stars,
+                      player.missed_stars, game.level_change_timer, game.stars_to_generate)
+
+class Session:
+    def __init__(self, sid, writer, mode, seed):
+        self.id = sid
+        self.writer = writer
+        self.game = sc.Game(seed)
+        self.game.reset_game(seed, mode)
+        self.mask = 0
+        self.ack = 0
+        self.sent = {}  # tick -> tables for every state the client may ack
+        self.ticks = deque()
+
+    def state_message(self, tick):
+        tables = world_tables(self.game)
+        base = self.sent.get(self.ack)
+        base_tick = self.ack if base is not None else 0
+        parts = [state_header(self.game, tick, base_tick)]
+        for k, table in enumerate(tables):
+            parts.append(encode_kind(table, base[k] if base is not None else None))
+
+        # The client only moves forward, so older bases can go
+        self.sent[tick] = tables
+        self.ticks.append(tick)
+        while self.ticks and (self.ticks[0] < self.ack or len(self.ticks) > HISTORY_TICKS):
+            del self.sent[self.ticks.popleft()]
+        return b"".join(parts)
+
+class GameServer:
+    def __init__(self, send_every=SEND_EVERY):
+        self.send_every = send_every
+        self.sessions = {}
+        self.connections = set()  # handler tasks, awaited on shutdown
+        self.next_id = 1
+        self.tick = 0
+        self.overruns = 0
+        # Totals since the last metrics() call
+        self.window_ticks = 0
+        self.window_busy = 0.0
+        self.window_bytes = 0
+        self.window_start = time.perf_counter()
+
+    async def handle(self, reader, writer):
+        # One connection: a HELLO opens its session, then inputs and resets
+        session = None
+        task = asyncio.current_task()
+        self.connections.add(task)
+        try:
+            while True:
+                (size,) = FRAME.unpack(await reader.readexactly(FRAME.size))
+                # Checked before reading, so a bad length never allocates
+                if not 0 < size <= MAX_CLIENT_MESSAGE:
+                    raise ValueError(f"message length {size}")
+                message = await reader.readexactly(size)
+                kind = message[0]
+                expected = CLIENT_MESSAGES.get(kind)
+                if expected is None or size != expected.size:
+                    raise ValueError(f"message type {kind} with {size} bytes")
+                if kind == MSG_INPUT and session is not None:
+                    _, session.mask, ack = INPUT.unpack(message)
+                    session.ack = max(session.ack, ack)
+                elif kind == MSG_HELLO and session is None:
+                    _, mode, seed = HELLO.unpack(message)
+                    if mode >= len(sc.GAME_MODES):
+                        raise ValueError(f"game mode {mode}")
+                    session = Session(self.next_id, writer, sc.GAME_MODES[mode], None if seed < 0 else seed)
+                    self.next_id += 1
+                    self.sessions[session.id] = session
+                    reply = WELCOME.pack(MSG_WELCOME, session.id, sc.FPS)
+                    writer.write(FRAME.pack(len(reply)) + reply)
+                elif kind == MSG_RESET and session is not None:
+                    session.game.reset_game()
+        except (asyncio.IncompleteReadError, ConnectionError):
+            pass
+        except (ValueError, struct.error) as error:
+            print(f"dropped client: {error}", file=sys.stderr, flush=True)
+        finally:
+            if session is not None:
+                del self.sessions[session.id]
+            self.connections.discard(task)
+            writer.close()
+
+    def step(self):
+        # One tick for every session, then their states
+        self.tick += 1
+        sessions = list(self.sessions.values())
+        for session in sessions:
+            session.game.step(session.mask)
+        if self.tick % self.send_every:
+            return
+        sent = 0
+        for session in sessions:
+            writer = session.writer
+            if writer.is_closing() or writer.transport.get_write_buffer_size() > WRITE_BUFFER_LIMIT:
+                continue
+            message = session.state_message(self.tick)
+            writer.write(FRAME.pack(len(message)) + message)
+            sent += FRAME.size + len(message)
+        self.window_bytes += sent
+
+    async def run(self):
+        # Fixed-rate scheduler; past the catch-up limit ticks are dropped
+        loop = asyncio.get_running_loop()
+        interval = 1.0 / sc.FPS
+        deadline = loop.time()
+        while True:
+            if loop.time() - deadline > interval * sc.MAX_CATCHUP_TICKS:
+                deadline = loop.time()
+                self.overruns += 1
+            start = time.perf_counter()
+            self.step()
+            self.window_busy += time.perf_counter() - start
+            self.window_ticks += 1
+            deadline += interval
+            await asyncio.sleep(max(0.0, deadline - loop.time()))
+
+    def metrics(self):
+        # Load is the share of tick time spent stepping and encoding; the
+        # sessions one core could hold follows from the cost per session
+        now = time.perf_counter()
+        ticks = max(self.window_ticks, 1)
+        sessions = len(self.sessions)
+        load = self.window_busy / max(now - self.window_start, 1e-9)
+        report = {
+            "sessions": sessions,
+            "ticks_per_second": self.window_ticks / max(now - self.window_start, 1e-9),
+            "load": load,
+            "tick_ms": self.window_busy * 1000.0 / ticks,
+            "sessions_per_core": sessions / load if load > 0 else 0.0,
+            "bytes_per_tick": self.window_bytes / ticks,
+            "bytes_per_session_tick": self.window_bytes / ticks / max(sessions, 1),
+            "overruns": self.overruns,
+        }
+        self.window_ticks = 0
+        self.window_busy = 0.0
+        self.window_bytes = 0
+        self.window_start = now
+        return report
+
+def format_metrics(report):
+    return (f"sessions: {report['sessions']}  tick: {report['tick_ms']:.2f} ms  load: {report['load']:.0%}  "
+            f"sessions/core: {report['sessions_per_core']:.0f}  bytes/tick: {report['bytes_per_tick']:.0f} "
+            f"({report['bytes_per_session_tick']:.0f} per session)  ticks/s: {report['ticks_per_second']:.1f}  "
+            f"overruns: {report['overruns']}")
+
+class Client:
+    # Connects to a GameServer, rebuilds the world from state deltas and
+    # acknowledges every state it decodes
+    def __init__(self):
+        self.reader = None
+        self.writer = None
+        self.session = None
+        self.header = None   # the latest STATE fields
+        self.tables = None   # the latest entity tables, as in world_tables
+        self.tick = 0
+        self.received = {}   # tick -> tables, possible delta bases
+
+    async def connect(self, host, port, mode="levels", seed=-1):
+        self.reader, self.writer = await asyncio.open_connection(host, port)
+        self.send(HELLO.pack(MSG_HELLO, sc.GAME_MODES.index(mode), seed))
+        message = await self.receive()
+        _, self.session, fps = WELCOME.unpack(message)
+
+    def send(self, message):
+        self.writer.write(FRAME.pack(len(message)) + message)
+
+    async def receive(self):
+        (size,) = FRAME.unpack(await self.reader.readexactly(FRAME.size))
+        return await self.reader.readexactly(size)
+
+    def apply(self, message):
+        header = STATE.unpack_from(message)
+        tick, base_tick = header[1], header[2]
+        base = self.received[base_tick] if base_tick else None
+        offset = STATE.size
+        tables = []
+        for k, (name, fields) in enumerate(ENTITY_KINDS):
+            table, offset = decode_kind(message, offset, base[k] if base is not None else None, len(fields))
+            tables.append(table)
+        self.header = header
+        self.tables = tables
+        self.tick = tick
+        self.received[tick] = tables
+        for old in [t for t in self.received if t < base_tick]:
+            del self.received[old]
+
+    async def play(self, policy):
+        # policy(client) returns the key mask to hold until the next state
+        while True:
+            message = await self.receive()
+            if message[0] == MSG_STATE:
+                self.apply(message)
+                self.send(INPUT.pack(MSG_INPUT, policy(self), self.tick))
+
+    def close(self):
+        if self.writer is not None:
+            self.writer.close()
+
+def bot_policy(seed):
+    # Holds a random direction for a while, always firing
+    rng = random.Random(seed)
+    state = {"mask": sc.INPUT_SHOOT, "left": 0}
+    def policy(client):
+        if state["left"] <= 0:
+            state["mask"] = sc.INPUT_SHOOT | rng.choice((0, sc.INPUT_LEFT, sc.INPUT_RIGHT, sc.INPUT_UP, sc.INPUT_DOWN))
+            state["left"] = rng.randint(10, 60)
+        state["left"] -= 1
+        if client.header[3] == sc.GAME_STATES.index("game_over"):
+            client.send(RESET.pack(MSG_RESET))
+        return state["mask"]
+    return policy
+
+async def report_metrics(server, interval):
+    while True:
+        await asyncio.sleep(interval)
+        print(format_metrics(server.metrics()), flush=True)
+
+async def serve(args):
+    server = GameServer(args.send_every)
+    listener = await asyncio.start_server(server.handle, args.host, 0 if args.bots else args.port)
+    port = listener.sockets[0].getsockname()[1]
+    tasks = [asyncio.create_task(server.run()), asyncio.create_task(report_metrics(server, args.stats_interval))]
+    clients = []
+    if args.bots:
+        # Load test: bot clients in this same loop, which adds their decoding
+        # cost to the process but not to the server's tick time
+        for i in range(args.bots):
+            client = Client()
+            await client.connect(args.host, port, args.mode, args.seed + i)
+            clients.append(client)
+            tasks.append(asyncio.create_task(client.play(bot_policy(args.seed + i))))
+    else:
+        print(f"listening on {args.host}:{port}", flush=True)
+    try:
+        if args.duration:
+            await asyncio.sleep(args.duration)
+            print(format_metrics(server.metrics()), flush=True)
+        else:
+            await asyncio.Event().wait()
+    finally:
+        for task in tasks:
+            task.cancel()
+        await asyncio.gather(*tasks, return_exceptions=True)
+        # Closed clients end their handlers, which drop their sessions
+        for client in clients:
+            client.close()
+        await asyncio.gather(*server.connections, return_exceptions=True)
+        listener.close()
+        await listener.wait_closed()
+
+def parse_args(argv=None):
+    parser = argparse.ArgumentParser(description="Host many Star Collector sessions in one process")
+    parser.add_argument("--host", default="127.0.0.1")
+    parser.add_argument("--port", type=int, default=7777)
+    parser.add_argument("--send-every", type=int, default=SEND_EVERY, help="ticks between state messages")
+    parser.add_argument("--stats-interval", type=float, default=STATS_INTERVAL,
+                        help="seconds between metric reports")
+    parser.add_argument("--bots", type=int, default=0, help="run this many local bot clients as a load test")
+    parser.add_argument("--mode", choices=sc.GAME_MODES, default="levels", help="game mode for --bots")
+    parser.add_argument("--seed", type=int, default=0, help="first bot session seed")
+    parser.add_argument("--duration", type=float, help="stop after this many seconds")
+    return parser.parse_args(argv)
+
+def main(argv=None):
+    args = parse_args(argv)
+    try:
+        asyncio.run(serve(args))
+    except KeyboardInterrupt:
+        pass
+    return 0
+
+if __name__ == "__main__":
+    sys.exit(main())
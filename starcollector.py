@@ -1,23 +1,35 @@
+import os
+import time
+IMPORT_START = time.perf_counter()
+os.environ.setdefault("PYGAME_HIDE_SUPPORT_PROMPT", "1")
+
 import pygame
-print(pygame.ver)
 import sys
 import math
 import random
+import copy
+import struct
+import json
+import csv
+import zlib
+import argparse
+import itertools
+import multiprocessing
+from array import array
+from collections import OrderedDict, deque
+from concurrent.futures import ThreadPoolExecutor
+import numpy as np
 from pygame.locals import *
 
-# Initialize pygame
-pygame.init()
-
 # Screen dimensions
 WIDTH, HEIGHT = 1000, 700
-screen = pygame.display.set_mode((WIDTH, HEIGHT))
-pygame.display.set_caption("Galactic Star Collector")
 
 # Colors
 BACKGROUND = (10, 10, 30)
 STAR_COLOR = (255, 255, 200)
 PLAYER_COLOR = (70, 130, 255)
 ENEMY_COLOR = (220, 60, 60)
+ENEMY_FLASH_COLOR = (255, 100, 100)
 BULLET_COLOR = (0, 255, 150)
 EXPLOSION_COLORS = [(255, 200, 0), (255, 100, 0), (255, 50, 0)]
 PLANET_COLORS = [
@@ -33,73 +45,380 @@ PLANET_COLORS = [
     (255, 255, 150)   # Light yellow
 ]
 TEXT_COLOR = (220, 220, 255)
+PROFILER_BACKGROUND = (20, 20, 20)
+PROFILER_OTHER = (150, 150, 150)
+PROFILER_COLORS = {
+    "events": (120, 120, 120),
+    "update.player": (70, 130, 255),
+    "update.stars": (255, 255, 140),
+    "update.enemies": (220, 60, 60),
+    "update.collisions": (255, 140, 220),
+    "update.resolve": (190, 100, 255),
+    "update.planets": (100, 200, 150),
+    "update.particles": (255, 150, 0),
+    "update.level": (160, 160, 220),
+    "update.endless": (255, 80, 80),
+    "draw.background": (40, 90, 160),
+    "draw.restore": (40, 140, 160),
+    "draw.planets": (60, 180, 120),
+    "draw.stars": (200, 200, 90),
+    "draw.enemies": (170, 50, 50),
+    "draw.particles": (200, 110, 0),
+    "draw.player": (90, 160, 255),
+    "draw.endless": (200, 60, 60),
+    "draw.hud": (220, 220, 255),
+    "draw.overlays": (140, 140, 200),
+    "profiler": (80, 80, 80),
+    "present": (0, 255, 150),
+    "idle": (45, 45, 45),
+}
 BUTTON_COLOR = (70, 130, 200)
 BUTTON_HOVER_COLOR = (100, 160, 230)
 
 # Game constants
-FPS = 60
+FPS = 60  # simulation ticks per second, all speeds below are per tick
+MAX_CATCHUP_TICKS = 5  # ticks one rendered frame may run to catch up
+RENDER_FPS_LIMIT = 240  # 0 renders as fast as the display allows
 PLAYER_SPEED = 8
 STAR_SPEED = 0.3
 ENEMY_SPEED_MIN = 3
 ENEMY_SPEED_MAX = 6
+ENEMY_BULLET_SPEED = 7
 LEVEL_CHANGE_DELAY = 120  # frames
 PLAYER_BULLET_SPEED = 12
 BULLET_COOLDOWN = 15  # frames between shots
+EXPLOSION_PARTICLES = 30
+EXPLOSION_LIFETIME = 30  # frames an explosion stays on screen
+PARTICLE_GRAVITY = 0.1
+COLLISION_CELL = 64  # spatial hash cell size in pixels
+BROADPHASE_MIN = 32  # below this many enemies a grid costs more than it saves
+BROADPHASE_BULLETS = 8  # nor with fewer player bullets than this to query it
+TEXT_CACHE_SIZE = 128  # rendered strings kept before the oldest is dropped
+BACKGROUND_STARS = 100
+TWINKLE_STEPS = 1024  # quantised twinkle phases per cycle
+PLANET_ROTATION_STEPS = 120  # distinct planet rotations, each baked at most once per level
+PLANET_PRELOAD_FRAMES = 4  # rotation frames baked ahead for the next level
+PLAYER_FLAME_LENGTHS = (9, 14, 6, 12, 5, 15, 8, 11)  # engine flame of each baked frame, in flicker order
+PLAYER_FLAME_MS = 40  # how long each flame frame shows
+MIN_RENDER_SCALE = 0.1  # smaller --render-scale values are raised to this
+SHIP_SPRITE_SCALES = 3  # render scales whose ship sprites are kept for switching back
+BULLETS_OUTLIVE_SHOOTER = False  # enemy bullets keep flying after their enemy is gone
+ENDLESS_WAVE_TICKS = 600  # endless mode gets harder every 10 seconds
+ENDLESS_ENEMIES = 3  # enemies in the first endless wave
+ENDLESS_GROWTH = 1.15  # per-wave growth of enemy count, fire rate and star spawns
+ENDLESS_MAX_ENEMIES = 20000
+ENDLESS_REFILL_TICKS = 120  # a wave's enemies arrive over about two seconds
+ENDLESS_DIRTY_LIMIT = 256  # more moving sprites than this redraw the whole screen
+PROFILER_HISTORY = 600  # frames kept for the profiler overlay
+PROFILER_GRAPH_SIZE = (300, 100)
+PROFILER_GRAPH_MS = 33.3  # frame time at the top of the profiler graph
+
+# Visual quality tiers, best first. QualityGovernor steps down when frames run
+# over budget and back up when there is headroom; no tier touches the
+# simulation, only how it is drawn.
+QUALITY_TIERS = (
+    {"name": "high", "background_stars": BACKGROUND_STARS, "glow": True, "burst_particles": 30, "planet_detail": True},
+    {"name": "medium", "background_stars": 50, "glow": True, "burst_particles": 15, "planet_detail": True},
+    {"name": "low", "background_stars": 25, "glow": False, "burst_particles": 8, "planet_detail": False},
+    {"name": "minimal", "background_stars": 0, "glow": False, "burst_particles": 4, "planet_detail": False},
+)
+QUALITY_BUDGET_MS = 1000 / 60
+QUALITY_WINDOW = 60  # frames averaged for each decision
+QUALITY_DOWN = 0.9   # step down above this share of the budget
+QUALITY_UP = 0.5     # step up below this share
+QUALITY_MAX_UP_DELAY = 60 * 60  # frames, longest wait before retrying a tier that was too slow
+
+# Input bitmask shared by the keyboard and scripted input
+INPUT_LEFT = 1
+INPUT_RIGHT = 2
+INPUT_UP = 4
+INPUT_DOWN = 8
+INPUT_SHOOT = 16
+
+# Fonts are created on first use by get_font, headless runs never touch them.
+# Resolving a system font name scans every installed font, so the resolved
+# files are kept in FONT_CACHE_PATH between runs.
+FONTS = {
+    # name: (system font names, size, bold)
+    "title": ("arial", 64, True),
+    "large": ("arial", 36, False),
+    "medium": ("arial", 28, False),
+    "small": ("arial", 22, False),
+    "mono": ("couriernew,dejavusansmono,monospace", 14, False),
+}
+FONT_CACHE_PATH = os.path.join(os.environ.get("XDG_CACHE_HOME") or os.path.expanduser("~/.cache"),
+                               "galactic-star-collector", "fonts.json")
+fonts = {}
+font_files = None  # system font names -> (file or None for pygame's default, fake bold)
+
+# Seconds spent in each startup phase, reported by --startup-times
+startup_times = {}
+
+# Pixels per world unit on the surface the game is drawn on. The simulation
+# always works in WIDTH x HEIGHT world units; RenderTarget changes this when
+# the game renders smaller or larger than that.
+render_scale = 1.0
+
+def ticks_ms():
+    # Milliseconds since the module was loaded. pygame.time.get_ticks needs
+    # the timer subsystem, which init_display does not start.
+    return int((time.perf_counter() - IMPORT_START) * 1000)
+
+def init_display(size=(WIDTH, HEIGHT), resizable=False):
+    # Only display and font: no audio, joystick or timer subsystems
+    start = time.perf_counter()
+    pygame.display.init()
+    pygame.font.init()
+    screen = pygame.display.set_mode(size, RESIZABLE if resizable else 0)
+    pygame.display.set_caption("Galactic Star Collector")
+    startup_times["display"] = time.perf_counter() - start
+    return screen
+
+def set_render_scale(scale):
+    # Everything drawn at the old scale is dropped and redrawn on use
+    global render_scale
+    if scale == render_scale:
+        return
+    render_scale = scale
+    text_cache.clear()
+    # Every font holds its file open: keep the current size and the 1.0 one
+    # the profiler overlay draws with
+    for key in [key for key in fonts if key[1] not in (scale, 1.0)]:
+        del fonts[key]
+    for cache in (glow_cache, star_sprite_cache, planet_cache):
+        cache.clear()
+    # Ship sprites stay for the most recent few scales only
+    if scale in ship_sprite_scales:
+        ship_sprite_scales.remove(scale)
+    ship_sprite_scales.append(scale)
+    while len(ship_sprite_scales) > SHIP_SPRITE_SCALES:
+        old = ship_sprite_scales.popleft()
+        for key in [key for key in ship_sprite_cache if key[2] == old]:
+            del ship_sprite_cache[key]
+
+def render_size():
+    # Pixel size of the whole world at render_scale
+    return round(WIDTH * render_scale), round(HEIGHT * render_scale)
+
+def scaled_rect(rect):
+    # A rect in world units on the render target
+    x, y, width, height = rect
+    s = render_scale
+    return pygame.Rect(x * s, y * s, width * s, height * s)
+
+def load_font_files():
+    try:
+        with open(FONT_CACHE_PATH) as f:
+            cached = json.load(f)
+    except (OSError, ValueError):
+        return {}
+    # Fonts that were uninstalled since are looked up again
+    return {key: tuple(entry) for key, entry in cached.items()
+            if entry[0] is None or os.path.exists(entry[0])}
+
+def save_font_files():
+    # Best effort, e.g. a read-only home directory only costs the next start
+    try:
+        os.makedirs(os.path.dirname(FONT_CACHE_PATH), exist_ok=True)
+        with open(FONT_CACHE_PATH, "w") as f:
+            json.dump(font_files, f, indent=1)
+    except OSError:
+        pass
+
+def resolve_font(names, bold):
+    # Pick the file the way SysFont does: a bold face when one is installed,
+    # otherwise the regular face (or pygame's default font) made bold
+    path = pygame.font.match_font(names, bold=bold)
+    if path is None:
+        return None, bold
+    if bold and path == pygame.font.match_font(names):
+        return path, True
+    return path, False
+
+def get_font(name, scale=None):
+    # Sized for render_scale unless a scale is given
+    global font_files
+    if scale is None:
+        scale = render_scale
+    font = fonts.get((name, scale))
+    if font is not None:
+        return font
+    
+    start = time.perf_counter()
+    names, size, bold = FONTS[name]
+    if font_files is None:
+        font_files = load_font_files()
+    key = f"{names}:{'bold' if bold else 'regular'}"
+    if key not in font_files:
+        font_files[key] = resolve_font(names, bold)
+        save_font_files()
+    path, fake_bold = font_files[key]
+    font = fonts[(name, scale)] = pygame.font.Font(path, max(1, round(size * scale)))
+    font.set_bold(fake_bold)
+    startup_times["fonts"] = startup_times.get("fonts", 0.0) + time.perf_counter() - start
+    return font
+
+def startup_report():
+    lines = [f"{phase:<12}{seconds * 1000:8.1f} ms" for phase, seconds in startup_times.items()]
+    total = sum(seconds for phase, seconds in startup_times.items() if phase != "fonts")
+    lines.append(f"{'total':<12}{total * 1000:8.1f} ms  (fonts are part of the first frame)")
+    return "\n".join(lines)
+
+def read_keyboard():
+    keys = pygame.key.get_pressed()
+    mask = 0
+    if keys[K_LEFT]:
+        mask |= INPUT_LEFT
+    if keys[K_RIGHT]:
+        mask |= INPUT_RIGHT
+    if keys[K_UP]:
+        mask |= INPUT_UP
+    if keys[K_DOWN]:
+        mask |= INPUT_DOWN
+    if keys[K_SPACE]:
+        mask |= INPUT_SHOOT
+    return mask
+
+def swap_remove(items, index):
+    # O(1) removal that does not keep the order of the remaining items
+    item = items[index]
+    last = items.pop()
+    if index < len(items):
+        items[index] = last
+    return item
+
+class ProjectileBuffer:
+    # Bullet positions packed into two double arrays instead of [x, y] lists
+    __slots__ = ("xs", "ys")
+    
+    def __init__(self):
+        self.xs = array("d")
+        self.ys = array("d")
+        
+    def __len__(self):
+        return len(self.xs)
+        
+    def __iter__(self):
+        return zip(self.xs, self.ys)
+        
+    def add(self, x, y):
+        self.xs.append(x)
+        self.ys.append(y)
+        
+    def remove_at(self, index):
+        xs, ys = self.xs, self.ys
+        last = len(xs) - 1
+        xs[index] = xs[last]
+        ys[index] = ys[last]
+        xs.pop()
+        ys.pop()
+        
+    def clear(self):
+        del self.xs[:]
+        del self.ys[:]
+        
+    def copy(self):
+        clone = ProjectileBuffer()
+        clone.xs = array("d", self.xs)
+        clone.ys = array("d", self.ys)
+        return clone
+        
+    def pack(self):
+        return pack_columns(len(self.xs), (self.xs, self.ys))
+        
+    def unpack(self, reader):
+        count, (xs, ys) = reader.columns((np.float64, np.float64))
+        self.xs = array("d", xs.tobytes())
+        self.ys = array("d", ys.tobytes())
+        
+    def advance(self, dy, min_y, max_y):
+        # Move every bullet and swap-remove the ones that leave [min_y, max_y]
+        xs, ys = self.xs, self.ys
+        i = 0
+        n = len(ys)
+        while i < n:
+            y = ys[i] + dy
+            if y < min_y or y > max_y:
+                n -= 1
+                xs[i] = xs[n]
+                ys[i] = ys[n]
+                xs.pop()
+                ys.pop()
+            else:
+                ys[i] = y
+                i += 1
+
+class EntityPool:
+    # Free list of retired entities, reset on reuse instead of rebuilt
+    def __init__(self, factory, limit=256):
+        self.factory = factory
+        self.limit = limit
+        self.free = []
+        
+    def acquire(self, *args):
+        if self.free:
+            item = self.free.pop()
+            item.reset(*args)
+            return item
+        return self.factory(*args)
+        
+    def release(self, item):
+        if len(self.free) < self.limit:
+            self.free.append(item)
+            
+    def acquire_blank(self):
+        # A retired or new entity left as it is, for the caller to fill in
+        return self.free.pop() if self.free else object.__new__(self.factory)
 
-# Fonts
-title_font = pygame.font.SysFont("arial", 64, bold=True)
-font_large = pygame.font.SysFont("arial", 36)
-font_medium = pygame.font.SysFont("arial", 28)
-font_small = pygame.font.SysFont("arial", 22)
+def copy_entity(item):
+    # Field-by-field copy of a Star or Enemy
+    clone = object.__new__(type(item))
+    for name, dtype in item.fields:
+        setattr(clone, name, getattr(item, name))
+    return clone
 
 class Player:
+    __slots__ = ("x", "y", "prev_x", "prev_y", "width", "height", "speed", "score",
+                 "collected_stars", "missed_stars", "bullets", "shoot_cooldown")
+    
     def __init__(self):
+        self.bullets = ProjectileBuffer()
         self.reset()
         
+    def copy(self):
+        clone = copy.copy(self)
+        clone.bullets = self.bullets.copy()
+        return clone
+        
     def reset(self):
-        self.x = WIDTH // 2
-        self.y = HEIGHT - 100
+        self.x = self.prev_x = WIDTH // 2
+        self.y = self.prev_y = HEIGHT - 100
         self.width = 60
         self.height = 40
         self.speed = PLAYER_SPEED
         self.score = 0
         self.collected_stars = 0
         self.missed_stars = 0
-        self.bullets = []
+        self.bullets.clear()
         self.shoot_cooldown = 0
         
-    def draw(self, surface):
-        # Draw the spaceship
-        points = [
-            (self.x, self.y - self.height//2),  # Top
-            (self.x - self.width//2, self.y + self.height//2),  # Bottom left
-            (self.x + self.width//2, self.y + self.height//2)   # Bottom right
-        ]
-        pygame.draw.polygon(surface, PLAYER_COLOR, points)
-        
-        # Draw cockpit
-        pygame.draw.circle(surface, (180, 230, 255), (self.x, self.y - 5), 10)
-        
-        # Draw engines
-        pygame.draw.rect(surface, (200, 200, 100), (self.x-15, self.y+15, 10, 15))
-        pygame.draw.rect(surface, (200, 200, 100), (self.x+5, self.y+15, 10, 15))
+    def draw(self, surface, alpha=1.0, dirty=None, flame=0):
+        # Position between the last two ticks, in render pixels
+        s = render_scale
+        x = (self.prev_x + (self.x - self.prev_x) * alpha) * s
+        y = (self.prev_y + (self.y - self.prev_y) * alpha) * s
         
-        # Draw engine flames
-        flame_length = random.randint(5, 15)
-        pygame.draw.polygon(surface, (255, 150, 0), [
-            (self.x-10, self.y+30),
-            (self.x-15, self.y+30+flame_length),
-            (self.x-5, self.y+30)
-        ])
-        pygame.draw.polygon(surface, (255, 150, 0), [
-            (self.x+10, self.y+30),
-            (self.x+15, self.y+30+flame_length),
-            (self.x+5, self.y+30)
-        ])
+        # Draw the spaceship, flame picks the engine flame frame
+        rect = surface.blit(player_sprite(flame), (x - 30 * s, y - 20 * s))
+        if dirty is not None:
+            dirty.append(rect)
         
-        # Draw bullets
-        for bullet in self.bullets:
-            pygame.draw.circle(surface, BULLET_COLOR, (bullet[0], bullet[1]), 4)
+        # Draw bullets, they move a fixed distance every tick
+        offset = PLAYER_BULLET_SPEED * (1 - alpha)
+        for bx, by in self.bullets:
+            rect = pygame.draw.circle(surface, BULLET_COLOR, (bx * s, (by + offset) * s), 4*s)
+            if dirty is not None:
+                dirty.append(rect)
         
     def move(self, direction):
         if direction == "left" and self.x - self.width//2 > 0:
@@ -114,63 +433,127 @@ class Player:
             
     def shoot(self):
         if self.shoot_cooldown <= 0:
-            self.bullets.append([self.x, self.y - self.height//2])
+            self.bullets.add(self.x, self.y - self.height//2)
             self.shoot_cooldown = BULLET_COOLDOWN
             
     def update(self):
         # Update bullets
-        for bullet in self.bullets[:]:
-            bullet[1] -= PLAYER_BULLET_SPEED
-            if bullet[1] < 0:
-                self.bullets.remove(bullet)
-                
+        self.bullets.advance(-PLAYER_BULLET_SPEED, 0, math.inf)
+        
         # Update cooldown
         if self.shoot_cooldown > 0:
             self.shoot_cooldown -= 1
 
+def display_format(surface, alpha=False):
+    # Convert to the display pixel format once a window exists
+    if pygame.display.get_surface() is None:
+        return surface
+    return surface.convert_alpha() if alpha else surface.convert()
+
+class TextCache:
+    # Rendered text surfaces keyed by (font, string, colour), least recently
+    # used entries are evicted first
+    def __init__(self, limit=TEXT_CACHE_SIZE):
+        self.limit = limit
+        self.surfaces = OrderedDict()
+        
+    def render(self, font, text, color):
+        key = (font, text, color)
+        surface = self.surfaces.get(key)
+        if surface is not None:
+            self.surfaces.move_to_end(key)
+            return surface
+        surface = self.surfaces[key] = font.render(text, True, color)
+        if len(self.surfaces) > self.limit:
+            self.surfaces.popitem(last=False)
+        return surface
+        
+    def clear(self):
+        self.surfaces.clear()
+
+text_cache = TextCache()
+
+def render_text(font, text, color):
+    return text_cache.render(font, text, color)
+
+# Glow sprites keyed by (star size, glow_timer); at most 8 sizes x 60 phases.
+# This and the other sprite caches below are drawn at render_scale and
+# emptied by set_render_scale.
+glow_cache = {}
+
+def glow_sprite(size, phase):
+    key = (size, phase)
+    sprite = glow_cache.get(key)
+    if sprite is None:
+        glow_size = size * render_scale * (1.5 + 0.5 * math.sin(phase * 0.1))
+        glow_surface = pygame.Surface((glow_size*2, glow_size*2), pygame.SRCALPHA)
+        pygame.draw.circle(glow_surface, (255, 255, 200, 100), (glow_size, glow_size), glow_size)
+        sprite = glow_cache[key] = (display_format(glow_surface, alpha=True), glow_size)
+    return sprite
+
 class Star:
-    def __init__(self):
-        self.reset()
+    __slots__ = ("x", "y", "prev_y", "speed", "size", "collected", "glow_timer")
+    fields = (("x", np.float64), ("y", np.float64), ("prev_y", np.float64), ("speed", np.float64),
+              ("size", np.int32), ("collected", np.bool_), ("glow_timer", np.int32))
+    
+    def __init__(self, rng):
+        self.reset(rng)
         
-    def reset(self):
-        self.x = random.randint(30, WIDTH - 30)
-        self.y = random.randint(-100, -20)
-        self.speed = STAR_SPEED + random.random() * 0.1  # Reduced variation
-        self.size = random.randint(8, 15)
+    def reset(self, rng):
+        self.x = rng.randint(30, WIDTH - 30)
+        self.y = self.prev_y = rng.randint(-100, -20)
+        self.speed = STAR_SPEED + rng.random() * 0.1  # Reduced variation
+        self.size = rng.randint(8, 15)
         self.collected = False
         self.glow_timer = 0
         
     def update(self):
+        self.prev_y = self.y
         self.y += self.speed
         self.glow_timer = (self.glow_timer + 1) % 60
         
-    def draw(self, surface):
+    def draw(self, surface, alpha=1.0, dirty=None, glow=True):
         if not self.collected:
+            s = render_scale
+            x = self.x * s
+            y = (self.prev_y + (self.y - self.prev_y) * alpha) * s
+            
             # Draw glow effect
-            glow_size = self.size * (1.5 + 0.5 * math.sin(self.glow_timer * 0.1))
-            glow_surface = pygame.Surface((glow_size*2, glow_size*2), pygame.SRCALPHA)
-            pygame.draw.circle(glow_surface, (255, 255, 200, 100), (glow_size, glow_size), glow_size)
-            surface.blit(glow_surface, (self.x - glow_size, self.y - glow_size))
+            rect = None
+            if glow:
+                glow_surface, glow_size = glow_sprite(self.size, self.glow_timer)
+                rect = surface.blit(glow_surface, (x - glow_size, y - glow_size))
             
             # Draw the star
-            pygame.draw.circle(surface, STAR_COLOR, (self.x, self.y), self.size)
+            core = pygame.draw.circle(surface, STAR_COLOR, (x, y), self.size * s)
+            if dirty is not None:
+                dirty.append(rect.union(core) if rect else core)
             
     def is_off_screen(self):
         return self.y > HEIGHT + 20
 
+enemy_ids = itertools.count()
+
 class Enemy:
-    def __init__(self, speed_factor):
-        self.reset(speed_factor)
+    __slots__ = ("uid", "x", "y", "prev_y", "speed", "width", "height", "shoot_timer",
+                 "hit_timer", "alive")
+    fields = (("uid", np.int64), ("x", np.float64), ("y", np.float64), ("prev_y", np.float64),
+              ("speed", np.float64), ("width", np.int32), ("height", np.int32),
+              ("shoot_timer", np.int32), ("hit_timer", np.int32), ("alive", np.bool_))
+    
+    def __init__(self, speed_factor, rng):
+        self.reset(speed_factor, rng)
         
-    def reset(self, speed_factor):
-        self.x = random.randint(50, WIDTH - 50)
-        self.y = random.randint(-200, -50)
+    def reset(self, speed_factor, rng):
+        # A fresh id for every spawn, pooled objects included, tags its bullets
+        self.uid = next(enemy_ids)
+        self.x = rng.randint(50, WIDTH - 50)
+        self.y = self.prev_y = rng.randint(-200, -50)
         base_speed = ENEMY_SPEED_MIN + (ENEMY_SPEED_MAX - ENEMY_SPEED_MIN) * 0.5
         self.speed = base_speed * speed_factor
         self.width = 50
         self.height = 30
-        self.shoot_timer = random.randint(60, 120)
-        self.bullets = []
+        self.shoot_timer = rng.randint(60, 120)
         self.hit_timer = 0
         self.alive = True
         
@@ -178,58 +561,31 @@ class Enemy:
         if not self.alive:
             return
             
+        self.prev_y = self.y
         self.y += self.speed
         self.shoot_timer -= 1
         
         # Update hit timer
         if self.hit_timer > 0:
             self.hit_timer -= 1
-            
-        # Update bullets
-        for bullet in self.bullets[:]:
-            bullet[1] += 7  # Bullet speed
-            if bullet[1] > HEIGHT:
-                self.bullets.remove(bullet)
                 
-    def draw(self, surface):
+    def draw(self, surface, alpha=1.0, dirty=None):
         if not self.alive:
             return
             
-        # Draw enemy ship
-        color = ENEMY_COLOR
-        if self.hit_timer > 0:
-            # Flash when hit
-            color = (255, 100, 100) if self.hit_timer % 4 < 2 else ENEMY_COLOR
-            
-        pygame.draw.polygon(surface, color, [
-            (self.x, self.y + self.height//2),  # Bottom
-            (self.x - self.width//2, self.y - self.height//2),  # Top left
-            (self.x + self.width//2, self.y - self.height//2)   # Top right
-        ])
-        
-        # Draw cockpit
-        pygame.draw.circle(surface, (255, 150, 150), (self.x, self.y), 8)
-        
-        # Draw wings
-        pygame.draw.polygon(surface, (180, 50, 50), [
-            (self.x - self.width//2, self.y),
-            (self.x - self.width//2 - 15, self.y + 15),
-            (self.x - self.width//2, self.y + 10)
-        ])
-        pygame.draw.polygon(surface, (180, 50, 50), [
-            (self.x + self.width//2, self.y),
-            (self.x + self.width//2 + 15, self.y + 15),
-            (self.x + self.width//2, self.y + 10)
-        ])
+        s = render_scale
+        y = (self.prev_y + (self.y - self.prev_y) * alpha) * s
         
-        # Draw bullets
-        for bullet in self.bullets:
-            pygame.draw.circle(surface, (255, 100, 100), (bullet[0], bullet[1]), 4)
+        # Draw enemy ship, flashing when hit
+        flash = self.hit_timer > 0 and self.hit_timer % 4 < 2
+        rect = surface.blit(enemy_sprite(flash), (self.x * s - 40 * s, y - 15 * s))
+        if dirty is not None:
+            dirty.append(rect)
             
-    def shoot(self):
+    def shoot(self, rng, bullets):
         if self.shoot_timer <= 0:
-            self.bullets.append([self.x, self.y + self.height//2])
-            self.shoot_timer = random.randint(60, 120)
+            bullets.append(self.x, self.y + self.height//2, self.uid)
+            self.shoot_timer = rng.randint(60, 120)
             
     def is_off_screen(self):
         return self.y > HEIGHT + 50
@@ -238,84 +594,702 @@ class Enemy:
         self.hit_timer = 5
         return True
 
-class Explosion:
-    def __init__(self, x, y):
-        self.x = x
-        self.y = y
-        self.particles = []
-        self.lifetime = 30
-        self.create_particles()
-        
-    def create_particles(self):
-        # Create explosion particles
-        for _ in range(30):
-            angle = random.uniform(0, math.pi * 2)
-            speed = random.uniform(1, 5)
-            size = random.randint(2, 8)
-            lifetime = random.randint(20, 40)
-            self.particles.append({
-                'x': self.x,
-                'y': self.y,
-                'dx': math.cos(angle) * speed,
-                'dy': math.sin(angle) * speed,
-                'size': size,
-                'lifetime': lifetime,
-                'color': random.choice(EXPLOSION_COLORS)
-            })
+# Particle sprites keyed by (colour index, radius in render pixels)
+particle_cache = {}
+
+def particle_sprite(color_index, size):
+    key = (color_index, size)
+    sprite = particle_cache.get(key)
+    if sprite is None:
+        sprite = pygame.Surface((size * 2, size * 2))
+        sprite.set_colorkey((0, 0, 0))
+        pygame.draw.circle(sprite, EXPLOSION_COLORS[color_index], (size, size), size)
+        sprite = particle_cache[key] = display_format(sprite)
+    return sprite
+
+# Sprites for entities drawn in bulk by EndlessMode
+star_sprite_cache = {}
+
+def star_sprite(size, phase):
+    # A star's glow and core in one surface, returns (sprite, centre offset).
+    # A phase of None is the core without glow.
+    key = (size, phase)
+    sprite = star_sprite_cache.get(key)
+    if sprite is None:
+        radius = size * render_scale
+        half = math.ceil(radius) + 1
+        if phase is not None:
+            glow_surface, glow_size = glow_sprite(size, phase)
+            half = math.ceil(max(glow_size, half))
+        surface = pygame.Surface((half * 2, half * 2), pygame.SRCALPHA)
+        if phase is not None:
+            surface.blit(glow_surface, (half - glow_size, half - glow_size))
+        pygame.draw.circle(surface, STAR_COLOR, (half, half), radius)
+        sprite = star_sprite_cache[key] = (display_format(surface, alpha=True), half)
+    return sprite
+
+# Ship and enemy bullet sprites keyed by (name, variant, render_scale). There
+# are only a dozen per scale, so unlike the caches above they are kept for the
+# last SHIP_SPRITE_SCALES scales and switching back costs nothing.
+ship_sprite_cache = {}
+ship_sprite_scales = deque([render_scale])  # least recently set first
+
+def keyed_sprite(surface):
+    # Ships are opaque, aliased shapes on black. A run-length encoded
+    # colorkey blits them several times faster than per-pixel alpha.
+    sprite = display_format(surface)
+    sprite.set_colorkey((0, 0, 0), RLEACCEL)
+    return sprite
+
+def player_sprite(frame):
+    # The player ship with flame PLAYER_FLAME_LENGTHS[frame], centred at
+    # (30, 20) world units
+    key = ("player", frame, render_scale)
+    sprite = ship_sprite_cache.get(key)
+    if sprite is None:
+        s = render_scale
+        def at(x, y):
+            return (30 + x) * s, (20 + y) * s
+        surface = pygame.Surface((math.ceil(61 * s), math.ceil(66 * s)))
+        pygame.draw.polygon(surface, PLAYER_COLOR, [at(0, -20), at(-30, 20), at(30, 20)])
+        pygame.draw.circle(surface, (180, 230, 255), at(0, -5), 10 * s)
+        for x in (-15, 5):
+            pygame.draw.rect(surface, (200, 200, 100), (*at(x, 15), 10 * s, 15 * s))
+        flame = PLAYER_FLAME_LENGTHS[frame]
+        for side in (-1, 1):
+            pygame.draw.polygon(surface, (255, 150, 0), [at(side * 10, 30), at(side * 15, 30 + flame),
+                                                         at(side * 5, 30)])
+        sprite = ship_sprite_cache[key] = keyed_sprite(surface)
+    return sprite
+
+def enemy_sprite(flash=False):
+    # The enemy ship centred at (40, 15) world units, in its hit colour
+    # when flash is set
+    key = ("enemy", flash, render_scale)
+    sprite = ship_sprite_cache.get(key)
+    if sprite is None:
+        s = render_scale
+        def at(x, y):
+            return (40 + x) * s, (15 + y) * s
+        surface = pygame.Surface((math.ceil(81 * s), math.ceil(31 * s)))
+        pygame.draw.polygon(surface, ENEMY_FLASH_COLOR if flash else ENEMY_COLOR,
+                            [at(0, 15), at(-25, -15), at(25, -15)])
+        pygame.draw.circle(surface, (255, 150, 150), at(0, 0), 8 * s)
+        for side in (-1, 1):
+            pygame.draw.polygon(surface, (180, 50, 50), [at(side * 25, 0), at(side * 40, 15), at(side * 25, 10)])
+        sprite = ship_sprite_cache[key] = keyed_sprite(surface)
+    return sprite
+
+def bake_ship_sprites():
+    # Every ship frame at the current scale, so none is drawn mid-game
+    for frame in range(len(PLAYER_FLAME_LENGTHS)):
+        player_sprite(frame)
+    enemy_sprite(False)
+    enemy_sprite(True)
+
+def enemy_bullet_sprite():
+    key = ("bullet", None, render_scale)
+    sprite = ship_sprite_cache.get(key)
+    if sprite is None:
+        radius = max(1, round(4 * render_scale))
+        surface = pygame.Surface((radius * 2 + 1, radius * 2 + 1))
+        surface.set_colorkey((0, 0, 0))
+        pygame.draw.circle(surface, (255, 100, 100), (radius, radius), radius)
+        sprite = ship_sprite_cache[key] = display_format(surface)
+    return sprite
+
+def copy_generator(rng):
+    # An independent NumPy generator continuing from rng's current state
+    clone = np.random.default_rng()
+    clone.bit_generator.state = rng.bit_generator.state
+    return clone
+
+class ArrayStore:
+    # Structure of arrays: one NumPy array per field, entries [0, count) are
+    # live. Subclasses list their fields and work on whole arrays at once.
+    fields = ()
+    
+    def __init__(self, capacity=256):
+        self.count = 0
+        self.capacity = 0
+        self.allocate(capacity)
+        
+    def allocate(self, capacity):
+        for name, dtype in self.fields:
+            arr = np.zeros(capacity, dtype)
+            if self.capacity:
+                arr[:self.count] = getattr(self, name)[:self.count]
+            setattr(self, name, arr)
+        self.capacity = capacity
+        
+    def reserve(self, count):
+        # Make room for count new entries and return their slice
+        if self.count + count > self.capacity:
+            self.allocate(max(self.capacity * 2, self.count + count))
+        start = self.count
+        self.count += count
+        return slice(start, self.count)
+        
+    def compact(self, keep):
+        # Drop the entries where keep is False, preserving order
+        n = self.count
+        live = int(np.count_nonzero(keep))
+        if live < n:
+            for name, dtype in self.fields:
+                arr = getattr(self, name)
+                arr[:live] = arr[:n][keep]
+            self.count = live
+            
+    def clear(self):
+        self.count = 0
+        
+    def copy(self):
+        clone = copy.copy(self)
+        for name, dtype in self.fields:
+            setattr(clone, name, getattr(self, name).copy())
+        return clone
+        
+    def pack(self):
+        n = self.count
+        return pack_columns(n, [getattr(self, name)[:n] for name, dtype in self.fields])
+        
+    def unpack(self, reader):
+        count, columns = reader.columns([dtype for name, dtype in self.fields])
+        self.count = 0
+        added = self.reserve(count)
+        for (name, dtype), column in zip(self.fields, columns):
+            getattr(self, name)[added] = column
+
+class ProjectileArray(ArrayStore):
+    # Bullets as arrays, moved and culled in one batch. owner is the id of
+    # whatever fired the bullet, -1 if nobody in particular.
+    fields = (("x", np.float64), ("y", np.float64), ("owner", np.int64))
+    
+    def add(self, xs, ys, owners=-1):
+        added = self.reserve(len(xs))
+        self.x[added] = xs
+        self.y[added] = ys
+        self.owner[added] = owners
+        
+    def append(self, x, y, owner=-1):
+        i = self.count
+        if i == self.capacity:
+            self.allocate(self.capacity * 2)
+        self.x[i] = x
+        self.y[i] = y
+        self.owner[i] = owner
+        self.count = i + 1
+        
+    def remove_owners(self, owners):
+        # Drop every bullet fired by one of the given owner ids
+        n = self.count
+        if n:
+            self.compact(~np.isin(self.owner[:n], owners))
             
+    def draw(self, surface, dy, alpha=1.0, dirty=None):
+        # dy is the per-tick motion, undone by 1 - alpha for in-between frames
+        n = self.count
+        if n == 0:
+            return None
+        sprite = enemy_bullet_sprite()
+        s = render_scale
+        half = sprite.get_width() // 2
+        offset = dy * (1 - alpha) * s + half
+        rects = surface.blits([(sprite, pos) for pos in
+                               zip((self.x[:n] * s - half).tolist(), (self.y[:n] * s - offset).tolist())],
+                              dirty is not None)
+        if dirty is not None:
+            dirty.extend(rects)
+        
+    def advance(self, dy, min_y, max_y):
+        n = self.count
+        if n == 0:
+            return
+        y = self.y[:n]
+        y += dy
+        self.compact((y >= min_y) & (y <= max_y))
+        
+    def hits(self, x, y, reach):
+        # Whether any bullet is within reach of (x, y) on both axes
+        n = self.count
+        return bool(np.any((np.abs(self.x[:n] - x) < reach) & (np.abs(self.y[:n] - y) < reach)))
+
+class ParticleSystem(ArrayStore):
+    # All explosion particles live in flat NumPy arrays, aged in batch
+    fields = (
+        ("x", np.float64), ("y", np.float64),
+        ("dx", np.float64), ("dy", np.float64),
+        ("size", np.int32), ("lifetime", np.int32), ("color", np.int8),
+    )
+    
+    def __init__(self, capacity=256):
+        self.rng = np.random.default_rng()
+        super().__init__(capacity)
+        
+    def copy(self):
+        clone = super().copy()
+        clone.rng = copy_generator(self.rng)
+        return clone
+        
+    def emit_burst(self, x, y, count=EXPLOSION_PARTICLES):
+        burst = self.reserve(count)
+        start, end = burst.start, burst.stop
+        rng = self.rng
+        angle = rng.uniform(0, math.pi * 2, count)
+        speed = rng.uniform(1, 5, count)
+        self.x[start:end] = x
+        self.y[start:end] = y
+        self.dx[start:end] = np.cos(angle) * speed
+        self.dy[start:end] = np.sin(angle) * speed
+        self.size[start:end] = rng.integers(2, 9, count)
+        # Particles never outlive the explosion that spawned them
+        self.lifetime[start:end] = np.minimum(rng.integers(20, 41, count), EXPLOSION_LIFETIME)
+        self.color[start:end] = rng.integers(0, len(EXPLOSION_COLORS), count)
+        
     def update(self):
-        self.lifetime -= 1
-        for p in self.particles:
-            p['x'] += p['dx']
-            p['y'] += p['dy']
-            p['lifetime'] -= 1
-            p['dy'] += 0.1  # Gravity effect
+        n = self.count
+        if n == 0:
+            return
+        self.x[:n] += self.dx[:n]
+        self.y[:n] += self.dy[:n]
+        self.lifetime[:n] -= 1
+        self.dy[:n] += PARTICLE_GRAVITY  # Gravity effect
+        
+        # Compact out dead particles
+        self.compact(self.lifetime[:n] > 0)
+        
+    def draw(self, surface, alpha=1.0, dirty=None):
+        n = self.count
+        if n == 0:
+            return
+        size = self.size[:n]
+        # Step back along this tick's motion for in-between frames
+        back = 1 - alpha
+        s = render_scale
+        x = (self.x[:n] - self.dx[:n] * back) * s
+        y = (self.y[:n] - (self.dy[:n] - PARTICLE_GRAVITY) * back) * s
+        radius = np.maximum((size * s + 0.5).astype(np.int32), 1)
+        px = (x.astype(np.int32) - radius).tolist()
+        py = (y.astype(np.int32) - radius).tolist()
+        sprites = [particle_sprite(c, r) for c, r in zip(self.color[:n].tolist(), radius.tolist())]
+        rects = surface.blits(list(zip(sprites, zip(px, py))), dirty is not None)
+        if dirty is not None:
+            # One box around a dense burst beats dozens of tiny updates
+            if len(rects) > 32:
+                rects = [rects[0].unionall(rects[1:])]
+            dirty.extend(rects)
+
+class StarArray(ArrayStore):
+    fields = (("x", np.float64), ("y", np.float64), ("prev_y", np.float64),
+              ("speed", np.float64), ("size", np.int32), ("glow", np.int32))
+
+class EnemyArray(ArrayStore):
+    # uid comes from the same counter as Enemy.uid and owns the enemy's bullets
+    fields = (("x", np.float64), ("y", np.float64), ("prev_y", np.float64),
+              ("speed", np.float64), ("shoot_timer", np.int32), ("uid", np.int64))
+
+class EndlessMode:
+    # Stars, enemies and enemy bullets for endless play. The same rules as
+    # the level game, but every entity kind lives in an ArrayStore and is
+    # moved, fired, culled and collided in batch so the waves can keep growing.
+    def __init__(self, bullets):
+        # bullets is the game's shared enemy bullet buffer
+        self.stars = StarArray()
+        self.enemies = EnemyArray()
+        self.bullets = bullets
+        self.rng = np.random.default_rng(0)
+        self.ticks = 0
+        
+    def copy(self, bullets):
+        clone = copy.copy(self)
+        clone.stars = self.stars.copy()
+        clone.enemies = self.enemies.copy()
+        clone.bullets = bullets
+        clone.rng = copy_generator(self.rng)
+        return clone
+        
+    def reset(self, seed):
+        # Seeded from the game's own stream so replays stay exact
+        self.rng = np.random.default_rng(seed)
+        self.stars.clear()
+        self.enemies.clear()
+        self.bullets.clear()
+        self.ticks = 0
+        
+    def wave(self):
+        return 1 + self.ticks // ENDLESS_WAVE_TICKS
+        
+    def entity_count(self):
+        return self.stars.count + self.enemies.count + self.bullets.count
+        
+    def nearest_star(self, x, y):
+        stars = self.stars
+        n = stars.count
+        visible = np.flatnonzero(stars.y[:n] > 0)
+        if visible.size == 0:
+            return None
+        i = visible[np.argmin(np.abs(stars.x[visible] - x) + np.abs(stars.y[visible] - y))]
+        return stars.x[i], stars.y[i]
+        
+    def spawn(self, growth):
+        rng = self.rng
+        
+        # Star groups: more likely and larger as the waves grow. Stars drift
+        # slowly and stay on screen for a long time, so this grows gently.
+        if rng.random() < min(0.25, 0.02 * growth):
+            count = int(rng.integers(1, 2 + self.wave() // 10))
+            base_x = rng.integers(100, WIDTH - 100)
+            base_y = rng.integers(-100, -20)
+            stars = self.stars
+            added = stars.reserve(count)
+            stars.x[added] = base_x + rng.integers(-100, 101, count)
+            stars.y[added] = stars.prev_y[added] = base_y + rng.integers(-40, 41, count)
+            stars.speed[added] = STAR_SPEED + rng.random(count) * 0.1
+            stars.size[added] = rng.integers(8, 16, count)
+            stars.glow[added] = 0
             
-    def draw(self, surface):
-        for p in self.particles:
-            if p['lifetime'] > 0:
-                alpha = min(255, p['lifetime'] * 8)
-                color = p['color']
-                pygame.draw.circle(surface, color, (int(p['x']), int(p['y'])), p['size'])
+        # Enemies refill towards the wave's target
+        enemies = self.enemies
+        target = min(int(ENDLESS_ENEMIES * growth), ENDLESS_MAX_ENEMIES)
+        missing = target - enemies.count
+        if missing > 0:
+            count = min(missing, max(1, target // ENDLESS_REFILL_TICKS))
+            speed_factor = min(0.3 + 0.05 * (self.wave() - 1), 1.5)
+            added = enemies.reserve(count)
+            enemies.x[added] = rng.integers(50, WIDTH - 50, count)
+            enemies.y[added] = enemies.prev_y[added] = rng.integers(-200, -50, count)
+            enemies.speed[added] = (ENEMY_SPEED_MIN + ENEMY_SPEED_MAX) * 0.5 * speed_factor
+            enemies.shoot_timer[added] = rng.integers(60, 121, count)
+            start = next(enemy_ids)
+            enemies.uid[added] = np.arange(start, start + count)
+            skip_enemy_ids(start + count - 1)
+            
+    def update(self, game):
+        self.ticks += 1
+        growth = ENDLESS_GROWTH ** (self.wave() - 1)
+        self.spawn(growth)
+        
+        # Move everything
+        stars = self.stars
+        n = stars.count
+        stars.prev_y[:n] = stars.y[:n]
+        stars.y[:n] += stars.speed[:n]
+        stars.glow[:n] = (stars.glow[:n] + 1) % 60
+        
+        enemies = self.enemies
+        m = enemies.count
+        enemies.prev_y[:m] = enemies.y[:m]
+        enemies.y[:m] += enemies.speed[:m]
+        enemies.shoot_timer[:m] -= 1
+        self.bullets.advance(ENEMY_BULLET_SPEED, -math.inf, HEIGHT)
+        
+        # Enemies whose timer ran out fire with the same per-tick chance as
+        # in the level game, which grows with the waves
+        ready = np.flatnonzero(enemies.shoot_timer[:m] <= 0)
+        if ready.size:
+            fire = ready[self.rng.random(ready.size) < min(1.0, 0.02 * growth)]
+            if fire.size:
+                self.bullets.add(enemies.x[fire], enemies.y[fire] + 15, enemies.uid[fire])
+                enemies.shoot_timer[fire] = self.rng.integers(60, 121, fire.size)
                 
-    def is_finished(self):
-        return self.lifetime <= 0
+        self.collide(game)
+        
+    def collide(self, game):
+        player = game.player
+        px, py = player.x, player.y
+        stars = self.stars
+        enemies = self.enemies
+        n = stars.count
+        m = enemies.count
+        ex = enemies.x[:m]
+        ey = enemies.y[:m]
+        
+        # Ships and enemy bullets vs player
+        if (np.any((np.abs(ex - px) < 40) & (np.abs(ey - py) < 30)) or
+                self.bullets.hits(px, py, 20)):
+            game.state = "game_over"
+        
+        # Player bullets vs enemies: each bullet kills the first live enemy
+        # it touches, as in CollisionSystem
+        keep = ey <= HEIGHT + 50
+        if m and len(player.bullets):
+            alive = np.ones(m, dtype=bool)
+            used = []
+            for b, (bx, by) in enumerate(player.bullets):
+                hit = np.flatnonzero(alive & (np.abs(ex - bx) < 25) & (np.abs(ey - by) < 25))
+                if hit.size:
+                    i = hit[0]
+                    alive[i] = False
+                    used.append(b)
+                    game.particles.emit_burst(ex[i], ey[i], game.quality["burst_particles"])
+                    player.score += 100
+            for b in reversed(used):
+                player.bullets.remove_at(b)
+            keep &= alive
+        if not game.bullets_outlive_shooter and not keep.all():
+            self.bullets.remove_owners(enemies.uid[:m][~keep])
+        enemies.compact(keep)
+        
+        # Collect stars, the ones that drift off screen are simply gone
+        sx = stars.x[:n]
+        sy = stars.y[:n]
+        collected = (np.abs(sx - px) < 30) & (np.abs(sy - py) < 30)
+        count = int(np.count_nonzero(collected))
+        if count:
+            player.collected_stars += count
+            player.score += 10 * self.wave() * count
+        stars.compact(~collected & (sy <= HEIGHT + 20))
+        
+    def draw(self, surface, alpha=1.0, dirty=None, glow=True):
+        track = dirty is not None
+        rects = []
+        s = render_scale
+        
+        stars = self.stars
+        n = stars.count
+        if n:
+            x = stars.x[:n] * s
+            y = (stars.prev_y[:n] + (stars.y[:n] - stars.prev_y[:n]) * alpha) * s
+            phases = stars.glow[:n].tolist() if glow else [None] * n
+            sprites = [star_sprite(size, phase) for size, phase in
+                       zip(stars.size[:n].tolist(), phases)]
+            rects += surface.blits([(sprite, (x - half, y - half)) for (sprite, half), x, y in
+                                    zip(sprites, x.tolist(), y.tolist())], track) or []
+        
+        enemies = self.enemies
+        m = enemies.count
+        if m:
+            sprite = enemy_sprite()
+            y = (enemies.prev_y[:m] + (enemies.y[:m] - enemies.prev_y[:m]) * alpha) * s - 15 * s
+            rects += surface.blits([(sprite, pos) for pos in
+                                    zip((enemies.x[:m] * s - 40 * s).tolist(), y.tolist())], track) or []
+        
+        self.bullets.draw(surface, ENEMY_BULLET_SPEED, alpha, rects if track else None)
+        
+        if track:
+            if len(rects) > ENDLESS_DIRTY_LIMIT:
+                rects = [surface.get_rect()]
+            dirty.extend(rects)
+
+planet_cache = {}
+
+def planet_reach(size, scale=1.0):
+    # Details reach 0.7 + 0.6 radii from the centre, rings stick out 10 units.
+    # In render pixels at the given scale.
+    return math.ceil(max(size * scale * 1.3, (size + 10) * scale)) + 1
+
+def planet_sprite(size, color, ring, step):
+    # Every planet of a level has the same size, colour and rotation, so they
+    # all blit one shared frame. Frames are drawn the first time a rotation
+    # step is reached and kept for the whole level, a planet turns about
+    # once a minute; Game.generate_planets clears them on level change.
+    # A step of None is the plain planet without its rotating details.
+    key = (size, color, ring, step, render_scale)
+    sprite = planet_cache.get(key)
+    if sprite is None:
+        sprite = planet_cache[key] = bake_planet_frame(*key)
+    return sprite
+
+def bake_planet_frame(size, color, ring, step, scale=1.0):
+    # Frames are baked mid-game, so they are created in the display format
+    # rather than converted afterwards
+    reach = planet_reach(size, scale)
+    radius = size * scale
+    display = pygame.display.get_surface()
+    surface = pygame.Surface((reach * 2, reach * 2), 0, display) if display else pygame.Surface((reach * 2, reach * 2))
+    rotation = (step or 0) * 2 * math.pi / PLANET_ROTATION_STEPS
+    
+    # Draw planet
+    pygame.draw.circle(surface, color, (reach, reach), radius)
+    
+    # Draw planet details
+    for i in range(5 if step is not None else 0):
+        detail_size = radius * (0.2 + 0.1 * i)
+        detail_x = reach + math.sin(rotation + i) * (radius * 0.7)
+        detail_y = reach + math.cos(rotation + i) * (radius * 0.7)
+        pygame.draw.circle(surface, 
+                          (max(0, min(255, color[0] - 30*i)), 
+                           max(0, min(255, color[1] - 30*i)), 
+                           max(0, min(255, color[2] - 30*i))), 
+                          (detail_x, detail_y), detail_size)
+    
+    # Draw ring for some planets
+    if ring:
+        ring_width = round(10 * scale)
+        ring_rect = pygame.Rect(reach - radius - ring_width, reach - ring_width//2, 
+                               radius * 2 + ring_width * 2, ring_width)
+        pygame.draw.ellipse(surface, (200, 200, 220), ring_rect, max(1, round(3 * scale)))
+    
+    # Run-length encoded colorkey: blitting skips the transparent corners
+    surface.set_colorkey((0, 0, 0), RLEACCEL)
+    return surface, reach
+
+def bake_level_planets(planets, scale):
+    # The frames a level's planets show first at the given scale, keyed as in
+    # planet_cache. Touches nothing shared, render_scale included, so it can
+    # run off the main thread.
+    frames = {}
+    for planet in planets:
+        first = planet.rotation_step()
+        for step in range(first, first + PLANET_PRELOAD_FRAMES):
+            key = (planet.size, planet.color, planet.ring, step % PLANET_ROTATION_STEPS, scale)
+            if key not in frames:
+                frames[key] = bake_planet_frame(*key)
+    return frames
+
+class LevelPreloader:
+    # Prepares the next level while the level-complete banner is up. The
+    # planets are placed on the main thread and their frames baked in a
+    # worker; Game swaps both in on the frame the level changes. Gameplay
+    # state draws from Game.rng and is still built on that frame, so seeded
+    # runs and replays are unaffected.
+    def __init__(self):
+        self.executor = ThreadPoolExecutor(max_workers=1, thread_name_prefix="level-preload")
+        self.level = None
+        self.planets = None
+        self.scale = None
+        self.frames = None
+        
+    def start(self, level, planets):
+        self.cancel()
+        self.level = level
+        self.planets = planets
+        self.scale = render_scale
+        self.frames = self.executor.submit(bake_level_planets, planets, self.scale)
+        
+    def take(self, level):
+        # (planets, frames) for the level if it was prepared, else None.
+        # Frames that are not ready yet, failed to bake or were baked for a
+        # render scale the window has since left are dropped and baked on
+        # first draw.
+        if self.level != level:
+            self.cancel()
+            return None
+        frames = {}
+        if self.frames.done() and self.scale == render_scale:
+            try:
+                frames = self.frames.result()
+            except Exception as error:
+                print(f"level {level} preload failed: {error!r}", file=sys.stderr)
+        prepared = (self.planets, frames)
+        self.cancel()
+        return prepared
+        
+    def cancel(self):
+        if self.frames is not None:
+            self.frames.cancel()
+        self.level = None
+        self.planets = None
+        self.scale = None
+        self.frames = None
+        
+    def close(self):
+        # cancel() already dropped the only queued bake
+        self.cancel()
+        self.executor.shutdown(wait=False)
 
 class Planet:
-    def __init__(self, level):
+    def __init__(self, level, x=None, y=None, rotation=0):
         self.level = level
         self.size = 80 + level * 10
-        self.x = random.randint(self.size, WIDTH - self.size)
-        self.y = random.randint(self.size, HEIGHT - self.size)
+        self.x = random.randint(self.size, WIDTH - self.size) if x is None else x
+        self.y = random.randint(self.size, HEIGHT - self.size) if y is None else y
         self.color = PLANET_COLORS[level % len(PLANET_COLORS)]
-        self.rotation = 0
+        self.rotation = rotation
         self.ring = level % 3 == 0  # Some planets have rings
         
     def update(self):
         self.rotation = (self.rotation + 0.002) % (2 * math.pi)
         
-    def draw(self, surface):
-        # Draw planet
-        pygame.draw.circle(surface, self.color, (self.x, self.y), self.size)
-        
-        # Draw planet details
-        for i in range(5):
-            detail_size = self.size * (0.2 + 0.1 * i)
-            detail_x = self.x + math.sin(self.rotation + i) * (self.size * 0.7)
-            detail_y = self.y + math.cos(self.rotation + i) * (self.size * 0.7)
-            # FIXED: Add max(0, ...) to prevent negative color values
-            pygame.draw.circle(surface, 
-                              (max(0, min(255, self.color[0] - 30*i)), 
-                               max(0, min(255, self.color[1] - 30*i)), 
-                               max(0, min(255, self.color[2] - 30*i))), 
-                              (detail_x, detail_y), detail_size)
-        
-        # Draw ring for some planets
-        if self.ring:
-            ring_width = 10
-            ring_rect = pygame.Rect(self.x - self.size - ring_width, self.y - ring_width//2, 
-                                   self.size * 2 + ring_width * 2, ring_width)
-            pygame.draw.ellipse(surface, (200, 200, 220), ring_rect, 3)
+    def rotation_step(self, detail=True):
+        # Without details there is nothing to rotate, so one frame serves
+        if not detail:
+            return None
+        return int(self.rotation / (2 * math.pi) * PLANET_ROTATION_STEPS)
+        
+    def bounds(self):
+        # Area covered on the render target
+        s = render_scale
+        reach = planet_reach(self.size, s)
+        return pygame.Rect(self.x * s - reach, self.y * s - reach, reach * 2, reach * 2)
+        
+    def draw(self, surface, detail=True):
+        # One blit of the baked frame for the current rotation step
+        sprite, reach = planet_sprite(self.size, self.color, self.ring, self.rotation_step(detail))
+        surface.blit(sprite, (self.x * render_scale - reach, self.y * render_scale - reach))
+
+class Background:
+    # Laid out in width x height world units and drawn at scale pixels each
+    def __init__(self, width, height, star_count=BACKGROUND_STARS, scale=1.0):
+        self.width = width
+        self.height = height
+        self.star_count = star_count
+        self.scale = scale
+        
+        # Twinkling stars: position, radius and phase offset
+        self.stars = []
+        for i in range(star_count):
+            x = round((i * 17) % width * scale)
+            y = round((i * 23) % height * scale)
+            size = max(1, round((1 + (i % 3)) * scale))
+            rect = pygame.Rect(x - size - 1, y - size - 1, size * 2 + 3, size * 2 + 3)
+            self.stars.append((x, y, size, i, rect))
+        # Stars whose circles overlap each star's refresh area
+        self.neighbours = [
+            [other for other in self.stars if other[4].colliderect(star[4])]
+            for star in self.stars
+        ]
+        
+        # Nebula surfaces are built once and only ever blitted
+        self.nebulae = []
+        for i in range(3):
+            alpha = 30
+            color = (50 + i*40, 50, 100 + i*50, alpha)
+            x = (width * 0.2 + i * 200) * scale
+            y = (height * 0.3 + i * 100) * scale
+            radius = round((150 + i * 50) * scale)
+            nebula_surf = pygame.Surface((radius*2, radius*2), pygame.SRCALPHA)
+            pygame.draw.circle(nebula_surf, color, (radius, radius), radius)
+            self.nebulae.append((nebula_surf, (x - radius, y - radius)))
+        
+        # Static layer: space colour with the nebulae on top
+        self.base = display_format(pygame.Surface((round(width * scale), round(height * scale))))
+        self.base.fill(BACKGROUND)
+        for nebula_surf, pos in self.nebulae:
+            self.base.blit(nebula_surf, pos)
+        
+        self.surface = self.base.copy()
+        self.phase = None
+        
+    def twinkle_phase(self, ticks):
+        return int(ticks * 0.0001 / (2 * math.pi) * TWINKLE_STEPS) % TWINKLE_STEPS
+        
+    def update(self, ticks):
+        # Re-render only the star areas, and only when the phase changes
+        phase = self.twinkle_phase(ticks)
+        if phase == self.phase:
+            return False
+        self.phase = phase
+        t = phase * 2 * math.pi / TWINKLE_STEPS
+        
+        surface = self.surface
+        for star, neighbours in zip(self.stars, self.neighbours):
+            surface.set_clip(star[4])
+            surface.fill(BACKGROUND)
+            for x, y, size, i, rect in neighbours:
+                brightness = 150 + 105 * math.sin(t + i)
+                pygame.draw.circle(surface, (brightness, brightness, brightness), (x, y), size)
+            for nebula_surf, pos in self.nebulae:
+                surface.blit(nebula_surf, pos)
+        surface.set_clip(None)
+        return True
+        
+    def star_rects(self):
+        return [star[4] for star in self.stars]
+        
+    def draw(self, surface, ticks):
+        self.update(ticks)
+        surface.blit(self.surface, (0, 0))
 
 class Button:
     def __init__(self, x, y, width, height, text):
@@ -324,12 +1298,15 @@ class Button:
         self.hovered = False
         
     def draw(self, surface):
+        # rect is in world units, like the mouse position it is checked against
         color = BUTTON_HOVER_COLOR if self.hovered else BUTTON_COLOR
-        pygame.draw.rect(surface, color, self.rect, border_radius=12)
-        pygame.draw.rect(surface, (200, 230, 255), self.rect, 3, border_radius=12)
+        rect = scaled_rect(self.rect)
+        radius = round(12 * render_scale)
+        pygame.draw.rect(surface, color, rect, border_radius=radius)
+        pygame.draw.rect(surface, (200, 230, 255), rect, max(1, round(3 * render_scale)), border_radius=radius)
         
-        text_surf = font_medium.render(self.text, True, (255, 255, 255))
-        text_rect = text_surf.get_rect(center=self.rect.center)
+        text_surf = render_text(get_font("medium"), self.text, (255, 255, 255))
+        text_rect = text_surf.get_rect(center=rect.center)
         surface.blit(text_surf, text_rect)
         
     def check_hover(self, pos):
@@ -340,61 +1317,588 @@ class Button:
             return self.rect.collidepoint(pos)
         return False
 
-class Game:
+class SpatialHash:
+    # Uniform grid of buckets keyed by cell, rebuilt every tick
+    def __init__(self, cell_size=COLLISION_CELL):
+        self.cell_size = cell_size
+        self.cells = {}
+        self.used = []  # buckets filled since the last clear
+        
+    def clear(self):
+        # Empty the buckets but keep them, so a rebuild allocates nothing
+        for bucket in self.used:
+            bucket.clear()
+        self.used.clear()
+        if len(self.cells) > 4096:
+            self.cells.clear()
+        
+    def insert(self, item, x, y):
+        key = (int(x // self.cell_size), int(y // self.cell_size))
+        bucket = self.cells.get(key)
+        if bucket is None:
+            bucket = self.cells[key] = []
+        if not bucket:
+            self.used.append(bucket)
+        bucket.append(item)
+            
+    def query(self, x, y, reach_x, reach_y):
+        # Items whose point may lie within reach of (x, y)
+        size = self.cell_size
+        cells = self.cells
+        found = []
+        cy0 = int((y - reach_y) // size)
+        cy1 = int((y + reach_y) // size) + 1
+        for cx in range(int((x - reach_x) // size), int((x + reach_x) // size) + 1):
+            for cy in range(cy0, cy1):
+                bucket = cells.get((cx, cy))
+                if bucket:
+                    found += bucket
+        return found
+
+class CollisionReport:
+    __slots__ = ("collected_stars", "player_hit", "kills")
+    
+    def __init__(self):
+        self.collected_stars = []  # stars touched by the player
+        self.player_hit = False    # enemy ship or enemy bullet touched the player
+        self.kills = []            # (bullet index, enemy index) in bullet order
+        
+    def clear(self):
+        self.collected_stars.clear()
+        self.player_hit = False
+        self.kills.clear()
+
+class CollisionSystem:
+    def __init__(self):
+        self.enemy_grid = SpatialHash()
+        self.report = CollisionReport()
+        
+    def check(self, player, stars, enemies, enemy_bullets):
+        # The report is reused every tick, read it before the next check
+        report = self.report
+        report.clear()
+        px, py = player.x, player.y
+        
+        # Stars vs player: a grid for one query costs more than a plain scan
+        for star in stars:
+            if (not star.collected and 
+                abs(star.x - px) < 30 and 
+                abs(star.y - py) < 30):
+                report.collected_stars.append(star)
+        
+        # Enemies vs player. The enemy grid only pays for itself once many
+        # player bullets query it; the player alone never gets that far.
+        grid = None
+        nearby = range(len(enemies))
+        if len(enemies) >= BROADPHASE_MIN and len(player.bullets) >= BROADPHASE_BULLETS:
+            grid = self.enemy_grid
+            grid.clear()
+            insert = grid.insert
+            for i, enemy in enumerate(enemies):
+                if enemy.alive:
+                    insert(i, enemy.x, enemy.y)
+            nearby = grid.query(px, py, 40, 30)
+        for i in nearby:
+            enemy = enemies[i]
+            if enemy.alive and abs(enemy.x - px) < 40 and abs(enemy.y - py) < 30:
+                report.player_hit = True
+                break
+        
+        # Enemy bullets vs player (the outcome is already known once hit)
+        if not report.player_hit and enemy_bullets.hits(px, py, 20):
+            report.player_hit = True
+        
+        # Player bullets vs enemies: each bullet hits the first live
+        # enemy in list order, each enemy dies to at most one bullet
+        if player.bullets and enemies:
+            killed = set()
+            everyone = range(len(enemies))
+            for b, bullet in enumerate(player.bullets):
+                target = None
+                nearby = everyone if grid is None else grid.query(bullet[0], bullet[1], 25, 25)
+                for i in nearby:
+                    if i in killed or (target is not None and i > target):
+                        continue
+                    enemy = enemies[i]
+                    if enemy.alive and abs(bullet[0] - enemy.x) < 25 and abs(bullet[1] - enemy.y) < 25:
+                        target = i
+                if target is not None:
+                    killed.add(target)
+                    report.kills.append((b, target))
+        return report
+
+class DirtyRenderer:
+    # Redraws only what changed since the last frame and returns those areas
+    # for pygame.display.update. The scene base holds everything static:
+    # background, nebulae and planets.
     def __init__(self):
+        self.base = None
+        self.planets = None
+        self.planet_steps = []
+        self.quality = None
+        self.background = None
+        self.prev_rects = []
+        self.hud_rects = []
+        self.hud = None
+        self.overlay = None
+        
+    def invalidate(self):
+        # Next frame is drawn in full, e.g. after the window was exposed
+        self.base = None
+        self.overlay = None
+        
+    def redraw_base(self, game, rect):
+        base = self.base
+        base.blit(game.background.surface, rect, rect)
+        base.set_clip(rect)
+        detail = game.quality["planet_detail"]
+        for planet in game.planets:
+            if rect.colliderect(planet.bounds()):
+                planet.draw(base, detail)
+        base.set_clip(None)
+        
+    def refresh_base(self, game):
+        # Areas of the scene base that changed, or None when it was rebuilt
+        background = game.current_background()
+        twinkled = background.update(game.ticks_ms())
+        
+        detail = game.quality["planet_detail"]
+        if (self.base is None or self.planets is not game.planets or self.quality is not game.quality
+                or self.background is not background):
+            self.base = background.surface.copy()
+            for planet in game.planets:
+                planet.draw(self.base, detail)
+            self.planets = game.planets
+            self.planet_steps = [planet.rotation_step(detail) for planet in game.planets]
+            self.quality = game.quality
+            self.background = background
+            return None
+        
+        changed = []
+        if twinkled:
+            changed.extend(game.background.star_rects())
+        for i, planet in enumerate(game.planets):
+            step = planet.rotation_step(detail)
+            if step != self.planet_steps[i]:
+                self.planet_steps[i] = step
+                changed.append(planet.bounds())
+        for rect in changed:
+            self.redraw_base(game, rect)
+        return changed
+        
+    def draw_full(self, game, surface, alpha):
+        surface.blit(self.base, (0, 0))
+        self.prev_rects = []
+        game.draw_entities(surface, alpha, self.prev_rects)
+        if game.profiler:
+            game.profiler.section("draw.hud")
+        self.hud_rects = game.draw_hud(surface)
+        self.hud = game.hud_key()
+        return [surface.get_rect()]
+        
+    def draw(self, game, surface, alpha=1.0):
+        prof = game.profiler
+        if prof:
+            prof.section("draw.background")
+        changed = self.refresh_base(game)
+        
+        # Menu, game over and level transition: redraw only when they change
+        overlay = game.overlay_key()
+        if overlay is not None:
+            if overlay == self.overlay and changed is not None:
+                return []
+            self.draw_full(game, surface, alpha)
+            if prof:
+                prof.section("draw.overlays")
+            game.draw_overlays(surface)
+            self.overlay = overlay
+            return [surface.get_rect()]
+        if self.overlay is not None or changed is None:
+            self.overlay = None
+            return self.draw_full(game, surface, alpha)
+        
+        # Restore where moving things were last frame, plus changed scenery
+        restore = self.prev_rects + changed
+        hud = game.hud_key()
+        hud_dirty = hud != self.hud or any(rect.collidelist(restore) != -1 for rect in self.hud_rects)
+        if hud_dirty:
+            restore.extend(self.hud_rects)
+        if prof:
+            prof.section("draw.restore")
+        base = self.base
+        for rect in restore:
+            surface.blit(base, rect, rect)
+        
+        drawn = []
+        game.draw_entities(surface, alpha, drawn)
+        
+        # Something moved under an untouched HUD: rebuild it there so the
+        # text stays on top
+        if prof:
+            prof.section("draw.hud")
+        if not hud_dirty and any(rect.collidelist(drawn) != -1 for rect in self.hud_rects):
+            for rect in self.hud_rects:
+                surface.set_clip(rect)
+                surface.blit(base, rect, rect)
+                game.draw_entities(surface, alpha)
+            surface.set_clip(None)
+            hud_dirty = True
+        if hud_dirty:
+            self.hud_rects = game.draw_hud(surface)
+            self.hud = hud
+            drawn.extend(self.hud_rects)
+        
+        self.prev_rects = drawn
+        if prof:
+            prof.end()
+        return restore + drawn
+
+class RenderTarget:
+    # The surface the game is drawn on and how it reaches the window. The
+    # world is fitted into the window keeping its aspect ratio (the view),
+    # drawn at scale times the view's resolution and stretched to fill it.
+    # At scale 1 in a world-sized window the game draws straight into the
+    # window. Only render_scale follows the size; the simulation never does.
+    def __init__(self, window, scale=1.0, smooth=True):
+        self.scale = scale
+        self.smooth = smooth  # smoothscale, otherwise nearest neighbour
+        self.resize(window)
+        
+    def resize(self, window):
+        # Call again whenever the window changes size
+        self.window = window
+        width, height = window.get_size()
+        fit = min(width / WIDTH, height / HEIGHT)
+        view = pygame.Rect(0, 0, round(WIDTH * fit), round(HEIGHT * fit))
+        view.center = (width // 2, height // 2)
+        self.view = view
+        set_render_scale(fit * self.scale)
+        bake_ship_sprites()
+        if render_size() == (width, height):
+            self.surface = window
+        else:
+            self.surface = pygame.Surface(render_size(), 0, window)
+            window.fill((0, 0, 0))
+        self.full = True
+        
+    def to_world(self, pos):
+        # A window position, e.g. the mouse, in world units
+        view = self.view
+        return ((pos[0] - view.x) * WIDTH / view.width, (pos[1] - view.y) * HEIGHT / view.height)
+        
+    def present(self, rects=None):
+        # Copy the frame to the window. rects are the target areas that
+        # changed, None for all of it; returns the window areas to update,
+        # None for the whole window.
+        if self.full:
+            self.full = False
+            rects = None
+        if self.surface is self.window or rects == []:
+            return rects
+        view = self.view
+        if self.surface.get_size() == view.size:
+            self.window.blit(self.surface, view)
+        elif self.smooth:
+            pygame.transform.smoothscale(self.surface, view.size, self.window.subsurface(view))
+        else:
+            pygame.transform.scale(self.surface, view.size, self.window.subsurface(view))
+        if rects is None:
+            return None
+        # Filtering blends neighbouring pixels, so each area grows a little
+        fx = view.width / self.surface.get_width()
+        fy = view.height / self.surface.get_height()
+        mapped = []
+        for rect in rects:
+            left = view.x + math.floor(rect.left * fx) - 1
+            top = view.y + math.floor(rect.top * fy) - 1
+            mapped.append(pygame.Rect(left, top, view.x + math.ceil(rect.right * fx) + 1 - left,
+                                      view.y + math.ceil(rect.bottom * fy) + 1 - top).clip(view))
+        return mapped
+
+class FrameProfiler:
+    # Named, back-to-back timing sections per frame. Game code calls
+    # section(name) only when game.profiler is set, so a disabled profiler
+    # costs one attribute check per phase.
+    def __init__(self, history=PROFILER_HISTORY):
+        self.origin = time.perf_counter()
+        self.frames = deque(maxlen=history)  # (start, end, [(name, start, end), ...])
+        self.spans = []
+        self.frame_start = None
+        self.current = None
+        self.current_start = 0.0
+        self.graph = None
+        self.graphed = 0
+        self.legend = []
+        self.legend_frame = 0
+        self.frame_count = 0
+        
+    def begin_frame(self):
+        self.frame_start = time.perf_counter()
+        self.spans = []
+        self.current = None
+        
+    def section(self, name):
+        # Close the running section and start the next one
+        now = time.perf_counter()
+        if self.current is not None:
+            self.spans.append((self.current, self.current_start, now))
+        self.current = name
+        self.current_start = now
+        
+    def end(self):
+        if self.current is not None:
+            self.spans.append((self.current, self.current_start, time.perf_counter()))
+            self.current = None
+            
+    def end_frame(self):
+        self.end()
+        if self.frame_start is not None:
+            self.frames.append((self.frame_start, time.perf_counter(), self.spans))
+            self.frame_count += 1
+        self.frame_start = None
+        
+    def totals(self, spans):
+        # Seconds per section name within one frame, in first-seen order
+        totals = {}
+        for name, start, end in spans:
+            totals[name] = totals.get(name, 0.0) + end - start
+        return totals
+    
+    def phases(self):
+        # Every section seen, known ones in frame order first
+        names = {}
+        for frame in self.frames:
+            for name, start, end in frame[2]:
+                names.setdefault(name, None)
+        order = list(PROFILER_COLORS)
+        return sorted(names, key=lambda name: order.index(name) if name in order else len(order))
+    
+    def summary(self):
+        # Mean and worst milliseconds per frame for every section
+        count = max(len(self.frames), 1)
+        stats = {}
+        for start, end, spans in self.frames:
+            for name, seconds in self.totals(spans).items():
+                entry = stats.setdefault(name, {"mean": 0.0, "max": 0.0})
+                entry["mean"] += seconds * 1000.0 / count
+                entry["max"] = max(entry["max"], seconds * 1000.0)
+        return stats
+    
+    def to_json(self):
+        origin = self.origin
+        return {
+            "frames": [
+                {"start": (start - origin) * 1000.0, "duration": (end - start) * 1000.0,
+                 "phases": {name: seconds * 1000.0 for name, seconds in self.totals(spans).items()}}
+                for start, end, spans in self.frames
+            ],
+            "summary": self.summary(),
+        }
+    
+    def to_trace(self):
+        # Chrome trace-event format (chrome://tracing, Perfetto), times in us
+        origin = self.origin
+        events = []
+        for number, (start, end, spans) in enumerate(self.frames):
+            events.append({"name": f"frame {number}", "cat": "frame", "ph": "X", "pid": 1, "tid": 1,
+                           "ts": (start - origin) * 1e6, "dur": (end - start) * 1e6})
+            for name, span_start, span_end in spans:
+                events.append({"name": name, "cat": name.split(".")[0], "ph": "X", "pid": 1, "tid": 1,
+                               "ts": (span_start - origin) * 1e6, "dur": (span_end - span_start) * 1e6})
+        return {"traceEvents": events, "displayTimeUnit": "ms"}
+    
+    def export(self, path, format=None):
+        # format is json, csv or trace; by default it follows the extension
+        if format is None:
+            format = "csv" if path.lower().endswith(".csv") else "json"
+        with open(path, "w", newline="") as f:
+            if format == "csv":
+                names = self.phases()
+                writer = csv.writer(f)
+                writer.writerow(["frame", "start_ms", "total_ms"] + names)
+                for number, (start, end, spans) in enumerate(self.frames):
+                    totals = self.totals(spans)
+                    writer.writerow([number, f"{(start - self.origin) * 1000.0:.4f}", f"{(end - start) * 1000.0:.4f}"]
+                                    + [f"{totals.get(name, 0.0) * 1000.0:.4f}" for name in names])
+            elif format == "trace":
+                json.dump(self.to_trace(), f)
+            else:
+                json.dump(self.to_json(), f, indent=1)
+                
+    def draw(self, surface):
+        # Scrolling graph of recent frames, one pixel column per frame,
+        # stacked by section. Only the newest column is drawn each frame.
+        width, height = PROFILER_GRAPH_SIZE
+        x, y = surface.get_width() - width - 10, surface.get_height() - height - 10
+        if self.graph is None:
+            self.graph = pygame.Surface((width, height))
+            self.graph.fill(PROFILER_BACKGROUND)
+        graph = self.graph
+        if self.frames and self.graphed != self.frame_count:
+            self.graphed = self.frame_count
+            start, end, spans = self.frames[-1]
+            graph.scroll(-1, 0)
+            graph.fill(PROFILER_BACKGROUND, (width - 1, 0, 1, height))
+            scale = height / PROFILER_GRAPH_MS / 1000.0
+            bottom = float(height)
+            for name, span_start, span_end in spans:
+                top = bottom - (span_end - span_start) * scale
+                color = PROFILER_COLORS.get(name, PROFILER_OTHER)
+                if int(bottom) > int(top):
+                    graph.fill(color, (width - 1, int(top), 1, int(bottom) - int(top)))
+                bottom = top
+            # Frame budget line
+            graph.set_at((width - 1, height - int(height * 1000.0 / FPS / PROFILER_GRAPH_MS)), (255, 255, 255))
+            
+        # Per-section averages, refreshed twice a second
+        if self.frame_count - self.legend_frame >= FPS // 2 or not self.legend:
+            self.legend_frame = self.frame_count
+            recent = list(self.frames)[-FPS:]
+            totals = {}
+            for start, end, spans in recent:
+                for name, seconds in self.totals(spans).items():
+                    totals[name] = totals.get(name, 0.0) + seconds
+            self.legend = [(name, totals[name] * 1000.0 / max(len(recent), 1)) for name in totals]
+            
+        rects = [surface.blit(graph, (x, y))]
+        line_height = get_font("mono", 1.0).get_linesize()
+        text_y = y - line_height * len(self.legend) - 4
+        rects.append(surface.fill(PROFILER_BACKGROUND, (x, text_y - 2, width, line_height * len(self.legend) + 4)))
+        for name, ms in self.legend:
+            color = PROFILER_COLORS.get(name, PROFILER_OTHER)
+            text = render_text(get_font("mono", 1.0), f"{name:<18}{ms:6.2f} ms", color)
+            rects.append(surface.blit(text, (x, text_y)))
+            text_y += line_height
+        return rects
+
+class QualityGovernor:
+    # Holds the frame time within budget by moving through QUALITY_TIERS.
+    # record() takes each frame's busy time in ms, without the frame cap's
+    # sleep, and returns the tier to draw the next frame with. A tier that
+    # turns out too slow right after a step up is retried later each time.
+    def __init__(self, budget_ms=QUALITY_BUDGET_MS, window=QUALITY_WINDOW, tier=0):
+        self.budget_ms = budget_ms
+        self.window = window
+        self.samples = deque(maxlen=window)
+        self.tier = tier
+        self.frame = 0
+        self.changed_at = 0
+        self.up_delay = window * 2
+        self.transitions = []  # (frame, from tier, to tier, mean frame ms)
+        self.tier_frames = [0] * len(QUALITY_TIERS)
+        
+    def record(self, ms):
+        self.frame += 1
+        self.tier_frames[self.tier] += 1
+        self.samples.append(ms)
+        if len(self.samples) < self.window:
+            return self.tier
+        mean = sum(self.samples) / len(self.samples)
+        since = self.frame - self.changed_at
+        if mean > self.budget_ms * QUALITY_DOWN and self.tier < len(QUALITY_TIERS) - 1:
+            last = self.transitions[-1] if self.transitions else None
+            if last is not None and last[2] < last[1] and since < self.up_delay:
+                self.up_delay = min(self.up_delay * 2, QUALITY_MAX_UP_DELAY)
+            self.change(self.tier + 1, mean)
+        elif mean < self.budget_ms * QUALITY_UP and self.tier > 0 and since >= self.up_delay:
+            self.change(self.tier - 1, mean)
+        return self.tier
+        
+    def change(self, tier, mean):
+        self.transitions.append((self.frame, self.tier, tier, mean))
+        self.tier = tier
+        self.changed_at = self.frame
+        self.samples.clear()
+        
+    def metrics(self):
+        names = [quality["name"] for quality in QUALITY_TIERS]
+        return {
+            "tier": names[self.tier],
+            "frames": self.frame,
+            "budget_ms": self.budget_ms,
+            "tier_frames": dict(zip(names, self.tier_frames)),
+            "transitions": [{"frame": frame, "from": names[old], "to": names[new], "mean_ms": round(mean, 3)}
+                            for frame, old, new, mean in self.transitions],
+        }
+
+# Level configurations, copied into every Game
+LEVEL_CONFIGS = [
+    # Level 1: Tutorial
+    {"stars_required": 8, "enemy_count": 2, "enemy_speed_factor": 0.3, 
+     "star_group_size": (1, 1), "spawn_chance": 0.02, "planet_count": 1},
+    
+    # Level 2: Basic Challenge
+    {"stars_required": 10, "enemy_count": 3, "enemy_speed_factor": 0.4, 
+     "star_group_size": (1, 2), "spawn_chance": 0.018, "planet_count": 1},
+    
+    # Level 3: Increasing Pace
+    {"stars_required": 12, "enemy_count": 4, "enemy_speed_factor": 0.5, 
+     "star_group_size": (1, 2), "spawn_chance": 0.016, "planet_count": 2},
+    
+    # Level 4: More Enemies
+    {"stars_required": 14, "enemy_count": 5, "enemy_speed_factor": 0.6, 
+     "star_group_size": (1, 3), "spawn_chance": 0.015, "planet_count": 2},
+    
+    # Level 5: Midway Challenge
+    {"stars_required": 16, "enemy_count": 6, "enemy_speed_factor": 0.7, 
+     "star_group_size": (2, 3), "spawn_chance": 0.014, "planet_count": 3},
+    
+    # Level 6: Faster Enemies
+    {"stars_required": 18, "enemy_count": 7, "enemy_speed_factor": 0.8, 
+     "star_group_size": (2, 3), "spawn_chance": 0.013, "planet_count": 3},
+    
+    # Level 7: Precision Required
+    {"stars_required": 20, "enemy_count": 8, "enemy_speed_factor": 0.9, 
+     "star_group_size": (2, 4), "spawn_chance": 0.012, "planet_count": 4},
+    
+    # Level 8: Expert Level
+    {"stars_required": 22, "enemy_count": 9, "enemy_speed_factor": 1.0, 
+     "star_group_size": (3, 4), "spawn_chance": 0.011, "planet_count": 4},
+    
+    # Level 9: Almost There
+    {"stars_required": 24, "enemy_count": 10, "enemy_speed_factor": 1.1, 
+     "star_group_size": (3, 5), "spawn_chance": 0.01, "planet_count": 5},
+    
+    # Level 10: Final Challenge
+    {"stars_required": 26, "enemy_count": 12, "enemy_speed_factor": 1.2, 
+     "star_group_size": (4, 5), "spawn_chance": 0.009, "planet_count": 5}
+]
+
+class Game:
+    def __init__(self, seed=None):
+        # Everything that affects play draws from self.rng; cosmetic effects
+        # (flames, planets, particles) use their own generators
+        self.seed = seed
+        self.rng = random.Random(seed)
+        self.recording = False  # record each session's input into self.replay
+        self.replay = None
         self.player = Player()
         self.stars = []
         self.enemies = []
         self.planets = []
-        self.explosions = []
-        self.level = 1
+        self.particles = ParticleSystem()
+        self.collisions = CollisionSystem()
+        self.profiler = None  # FrameProfiler timing each update and draw phase
+        self.preloader = None  # LevelPreloader building the next level's planets
+        self.ticks_ms = ticks_ms  # clock for time-based effects, video exports use the tick count
+        self.quality = QUALITY_TIERS[0]  # visual settings, see set_quality
+        self.screens = {}
+        self.fade_surface = None
+        self.star_pool = EntityPool(Star)
+        self.enemy_pool = EntityPool(Enemy)
+        self.background = None
+        self.level = 1  # the wave number in endless mode
         self.state = "menu"  # menu, playing, level_complete, game_over
+        self.mode = "levels"  # levels or endless
+        # Every enemy bullet in play, tagged with its shooter's uid
+        self.enemy_bullets = ProjectileArray()
+        self.bullets_outlive_shooter = BULLETS_OUTLIVE_SHOOTER
+        self.endless = EndlessMode(self.enemy_bullets)
         self.level_change_timer = 0
         self.stars_to_generate = 0
         self.stars_generated = 0
         
-        # Level configurations
-        self.level_configs = [
-            # Level 1: Tutorial
-            {"stars_required": 8, "enemy_count": 2, "enemy_speed_factor": 0.3, 
-             "star_group_size": (1, 1), "spawn_chance": 0.02, "planet_count": 1},
-            
-            # Level 2: Basic Challenge
-            {"stars_required": 10, "enemy_count": 3, "enemy_speed_factor": 0.4, 
-             "star_group_size": (1, 2), "spawn_chance": 0.018, "planet_count": 1},
-            
-            # Level 3: Increasing Pace
-            {"stars_required": 12, "enemy_count": 4, "enemy_speed_factor": 0.5, 
-             "star_group_size": (1, 2), "spawn_chance": 0.016, "planet_count": 2},
-            
-            # Level 4: More Enemies
-            {"stars_required": 14, "enemy_count": 5, "enemy_speed_factor": 0.6, 
-             "star_group_size": (1, 3), "spawn_chance": 0.015, "planet_count": 2},
-            
-            # Level 5: Midway Challenge
-            {"stars_required": 16, "enemy_count": 6, "enemy_speed_factor": 0.7, 
-             "star_group_size": (2, 3), "spawn_chance": 0.014, "planet_count": 3},
-            
-            # Level 6: Faster Enemies
-            {"stars_required": 18, "enemy_count": 7, "enemy_speed_factor": 0.8, 
-             "star_group_size": (2, 3), "spawn_chance": 0.013, "planet_count": 3},
-            
-            # Level 7: Precision Required
-            {"stars_required": 20, "enemy_count": 8, "enemy_speed_factor": 0.9, 
-             "star_group_size": (2, 4), "spawn_chance": 0.012, "planet_count": 4},
-            
-            # Level 8: Expert Level
-            {"stars_required": 22, "enemy_count": 9, "enemy_speed_factor": 1.0, 
-             "star_group_size": (3, 4), "spawn_chance": 0.011, "planet_count": 4},
-            
-            # Level 9: Almost There
-            {"stars_required": 24, "enemy_count": 10, "enemy_speed_factor": 1.1, 
-             "star_group_size": (3, 5), "spawn_chance": 0.01, "planet_count": 5},
-            
-            # Level 10: Final Challenge
-            {"stars_required": 26, "enemy_count": 12, "enemy_speed_factor": 1.2, 
-             "star_group_size": (4, 5), "spawn_chance": 0.009, "planet_count": 5}
-        ]
+        self.level_configs = list(LEVEL_CONFIGS)
         
         self.generate_stars()
         self.generate_enemies()
@@ -402,12 +1906,24 @@ class Game:
         
         # Create buttons
         button_width, button_height = 250, 60
-        self.start_button = Button(WIDTH//2 - button_width//2, HEIGHT//2, button_width, button_height, "Start Game")
+        self.start_button = Button(WIDTH//2 - button_width - 10, HEIGHT//2, button_width, button_height, "Start Game")
+        self.endless_button = Button(WIDTH//2 + 10, HEIGHT//2, button_width, button_height, "Endless Mode")
         self.retry_button = Button(WIDTH//2 - button_width//2, HEIGHT//2 + 100, button_width, button_height, "Try Again")
         
+    def clear_stars(self):
+        for star in self.stars:
+            self.star_pool.release(star)
+        self.stars.clear()
+        
+    def clear_enemies(self):
+        for enemy in self.enemies:
+            self.enemy_pool.release(enemy)
+        self.enemies.clear()
+        self.enemy_bullets.clear()
+        
     def generate_stars(self):
         config = self.level_configs[self.level - 1]
-        self.stars = []
+        self.clear_stars()
         self.stars_to_generate = config["stars_required"]
         self.stars_generated = 0
         self.star_group_size = config["star_group_size"]
@@ -415,122 +1931,194 @@ class Game:
         
     def generate_enemies(self):
         config = self.level_configs[self.level - 1]
-        self.enemies = []
+        self.clear_enemies()
         for _ in range(config["enemy_count"]):
-            self.enemies.append(Enemy(config["enemy_speed_factor"]))
+            self.enemies.append(self.enemy_pool.acquire(config["enemy_speed_factor"], self.rng))
             
     def generate_planets(self):
-        config = self.level_configs[self.level - 1]
-        self.planets = []
-        for _ in range(config["planet_count"]):
-            self.planets.append(Planet(self.level))
+        prepared = self.preloader.take(self.level) if self.preloader else None
+        planet_cache.clear()
+        if prepared is not None:
+            self.planets, frames = prepared
+            planet_cache.update(frames)
+            return
+        self.planets = self.make_planets(self.level)
+        
+    def make_planets(self, level):
+        config = self.level_configs[level - 1]
+        return [Planet(level) for _ in range(config["planet_count"])]
+        
+    def preload_next_level(self):
+        level = self.level + 1
+        if self.preloader and level <= len(self.level_configs):
+            self.preloader.start(level, self.make_planets(level))
     
     def spawn_star_group(self):
         if self.stars_generated < self.stars_to_generate:
-            group_size = random.randint(self.star_group_size[0], self.star_group_size[1])
-            base_x = random.randint(100, WIDTH - 100)
-            base_y = random.randint(-100, -20)
+            rng = self.rng
+            group_size = rng.randint(self.star_group_size[0], self.star_group_size[1])
+            base_x = rng.randint(100, WIDTH - 100)
+            base_y = rng.randint(-100, -20)
             
             for i in range(min(group_size, self.stars_to_generate - self.stars_generated)):
-                star = Star()
+                star = self.star_pool.acquire(rng)
                 # Position stars with more spacing
-                star.x = base_x + random.randint(-100, 100)
-                star.y = base_y + random.randint(-40, 40)
+                star.x = base_x + rng.randint(-100, 100)
+                star.y = star.prev_y = base_y + rng.randint(-40, 40)
                 self.stars.append(star)
                 self.stars_generated += 1
     
+    def handle_input(self, mask):
+        if self.state != "playing":
+            return
+        if mask & INPUT_LEFT:
+            self.player.move("left")
+        if mask & INPUT_RIGHT:
+            self.player.move("right")
+        if mask & INPUT_UP:
+            self.player.move("up")
+        if mask & INPUT_DOWN:
+            self.player.move("down")
+        if mask & INPUT_SHOOT:
+            self.player.shoot()
+    
+    def step(self, mask=0):
+        # One simulation tick: apply input, then advance the world
+        player = self.player
+        player.prev_x = player.x
+        player.prev_y = player.y
+        self.handle_input(mask)
+        self.update()
+        if self.profiler:
+            self.profiler.end()
+        
+        replay = self.replay
+        if replay is not None and not replay.finished:
+            replay.record(mask)
+            if self.state == "game_over":
+                replay.finish(self)
+    
     def update(self):
+        prof = self.profiler
+        
         # Update player (for bullets)
+        if prof:
+            prof.section("update.player")
         self.player.update()
             
         if self.state != "playing":
             return
+        if self.mode == "endless":
+            self.update_endless()
+            return
             
         # Spawn star groups
-        if random.random() < self.star_spawn_chance and self.stars_generated < self.stars_to_generate:
+        if prof:
+            prof.section("update.stars")
+        if self.rng.random() < self.star_spawn_chance and self.stars_generated < self.stars_to_generate:
             self.spawn_star_group()
             
         # Update stars
         for star in self.stars:
             star.update()
             
-            # Check if star is collected
-            if (not star.collected and 
-                abs(star.x - self.player.x) < 30 and 
-                abs(star.y - self.player.y) < 30):
-                star.collected = True
-                self.player.collected_stars += 1
-                self.player.score += 10 * self.level
+        # Update enemies
+        if prof:
+            prof.section("update.enemies")
+        # Bullets fired this tick start moving next tick
+        self.enemy_bullets.advance(ENEMY_BULLET_SPEED, -math.inf, HEIGHT)
+        for enemy in self.enemies:
+            enemy.update()
+            
+            # Enemy shooting
+            if self.rng.random() < 0.02 and enemy.alive:
+                enemy.shoot(self.rng, self.enemy_bullets)
                 
-            # Check if star is missed
+        # Resolve all collisions against this tick's positions
+        if prof:
+            prof.section("update.collisions")
+        report = self.collisions.check(self.player, self.stars, self.enemies, self.enemy_bullets)
+        
+        # Collect stars
+        if prof:
+            prof.section("update.resolve")
+        for star in report.collected_stars:
+            star.collected = True
+            self.player.collected_stars += 1
+            self.player.score += 10 * self.level
+            
+        # Check if star is missed
+        for star in self.stars:
             if star.is_off_screen() and not star.collected:
                 self.player.missed_stars += 1
                 star.collected = True  # Mark to remove
                 
         # Remove collected or missed stars
-        self.stars = [star for star in self.stars if not star.collected and not star.is_off_screen()]
+        stars = self.stars
+        i = 0
+        while i < len(stars):
+            if stars[i].collected or stars[i].is_off_screen():
+                self.star_pool.release(swap_remove(stars, i))
+            else:
+                i += 1
         
-        # Update enemies
-        for enemy in self.enemies[:]:
-            enemy.update()
+        # Check collision with player
+        if report.player_hit:
+            self.state = "game_over"
             
-            # Enemy shooting
-            if random.random() < 0.02 and enemy.alive:
-                enemy.shoot()
-                
-            # Check collision with player
-            if enemy.alive and (abs(enemy.x - self.player.x) < 40 and 
-                abs(enemy.y - self.player.y) < 30):
-                self.state = "game_over"
-                
-            # Check bullet collision with player
-            for bullet in enemy.bullets:
-                if (abs(bullet[0] - self.player.x) < 20 and 
-                    abs(bullet[1] - self.player.y) < 20):
-                    self.state = "game_over"
-                    
-        # Check player bullets hitting enemies
-        for bullet in self.player.bullets[:]:
-            for enemy in self.enemies[:]:
-                if enemy.alive and (abs(bullet[0] - enemy.x) < 25 and 
-                    abs(bullet[1] - enemy.y) < 25):
-                    # Remove bullet
-                    if bullet in self.player.bullets:
-                        self.player.bullets.remove(bullet)
-                    # Hit enemy
-                    enemy.hit()
-                    # Create explosion
-                    self.explosions.append(Explosion(enemy.x, enemy.y))
-                    # Mark enemy as dead
-                    enemy.alive = False
-                    # Remove enemy
-                    self.enemies.remove(enemy)
-                    # Add score
-                    self.player.score += 100
-                    break
-                    
-        # Remove enemies that go off screen
-        self.enemies = [enemy for enemy in self.enemies if not enemy.is_off_screen()]
+        # Player bullets hitting enemies
+        if report.kills:
+            for b, i in report.kills:
+                enemy = self.enemies[i]
+                # Hit enemy
+                enemy.hit()
+                # Create explosion
+                self.particles.emit_burst(enemy.x, enemy.y, self.quality["burst_particles"])
+                # Mark enemy as dead
+                enemy.alive = False
+                # Add score
+                self.player.score += 100
+            # Highest index first so swap-removal keeps lower indices valid
+            for b in sorted((b for b, i in report.kills), reverse=True):
+                self.player.bullets.remove_at(b)
+            
+        # Remove destroyed enemies and enemies that go off screen
+        enemies = self.enemies
+        removed = []
+        i = 0
+        while i < len(enemies):
+            if not enemies[i].alive or enemies[i].is_off_screen():
+                enemy = swap_remove(enemies, i)
+                removed.append(enemy.uid)
+                self.enemy_pool.release(enemy)
+            else:
+                i += 1
+        if removed and not self.bullets_outlive_shooter:
+            self.enemy_bullets.remove_owners(removed)
         
         # Add new enemies if needed
         config = self.level_configs[self.level - 1]
-        if len(self.enemies) < config["enemy_count"] and random.random() < 0.02:
-            self.enemies.append(Enemy(config["enemy_speed_factor"]))
+        if len(self.enemies) < config["enemy_count"] and self.rng.random() < 0.02:
+            self.enemies.append(self.enemy_pool.acquire(config["enemy_speed_factor"], self.rng))
             
         # Update planets
+        if prof:
+            prof.section("update.planets")
         for planet in self.planets:
             planet.update()
             
         # Update explosions
-        for explosion in self.explosions[:]:
-            explosion.update()
-            if explosion.is_finished():
-                self.explosions.remove(explosion)
+        if prof:
+            prof.section("update.particles")
+        self.particles.update()
             
         # Check if level is complete
+        if prof:
+            prof.section("update.level")
         if self.player.collected_stars >= self.stars_to_generate:
             if self.level_change_timer == 0:
                 self.level_change_timer = LEVEL_CHANGE_DELAY
+                self.preload_next_level()
             else:
                 self.level_change_timer -= 1
                 if self.level_change_timer <= 0:
@@ -549,66 +2137,149 @@ class Game:
         if self.player.missed_stars > 0:
             self.state = "game_over"
     
+    def update_endless(self):
+        prof = self.profiler
+        if prof:
+            prof.section("update.endless")
+        self.endless.update(self)
+        self.level = self.endless.wave()
+        
+        if prof:
+            prof.section("update.planets")
+        for planet in self.planets:
+            planet.update()
+        if prof:
+            prof.section("update.particles")
+        self.particles.update()
+    
+    def current_background(self):
+        # Baked once per quality tier and render scale
+        background = self.background
+        if background is None or background.scale != render_scale:
+            background = self.background = Background(WIDTH, HEIGHT, self.quality["background_stars"],
+                                                      render_scale)
+        return background
+        
     def draw_background(self, surface):
-        # Draw space background
-        surface.fill(BACKGROUND)
-        
-        # Draw stars in background
-        for i in range(100):
-            x = (i * 17) % WIDTH
-            y = (i * 23) % HEIGHT
-            size = 1 + (i % 3)
-            brightness = 150 + 105 * math.sin(pygame.time.get_ticks() * 0.0001 + i)
-            pygame.draw.circle(surface, (brightness, brightness, brightness), (x, y), size)
-        
-        # Draw nebula effects
-        for i in range(3):
-            alpha = 30
-            color = (50 + i*40, 50, 100 + i*50, alpha)
-            x = WIDTH * 0.2 + i * 200
-            y = HEIGHT * 0.3 + i * 100
-            radius = 150 + i * 50
-            nebula_surf = pygame.Surface((radius*2, radius*2), pygame.SRCALPHA)
-            pygame.draw.circle(nebula_surf, color, (radius, radius), radius)
-            surface.blit(nebula_surf, (x - radius, y - radius))
+        # Only the twinkling stars are refreshed
+        self.current_background().draw(surface, self.ticks_ms())
+        
+    def set_quality(self, tier):
+        # Switch to one of QUALITY_TIERS; the background is rebuilt lazily
+        # when its star count changes
+        quality = QUALITY_TIERS[tier]
+        if quality is self.quality:
+            return
+        if self.background is not None and self.background.star_count != quality["background_stars"]:
+            self.background = None
+        self.quality = quality
     
-    def draw(self, surface):
-        self.draw_background(surface)
+    def draw_entities(self, surface, alpha=1.0, dirty=None):
+        prof = self.profiler
+        # Outside play update() stops before the entities, so their previous
+        # positions are stale; draw them where they are
+        if self.state != "playing":
+            alpha = 1.0
+        
+        # Endless waves are drawn in bulk
+        if self.mode == "endless":
+            if prof:
+                prof.section("draw.endless")
+            self.endless.draw(surface, alpha, dirty, self.quality["glow"])
         
-        # Draw planets
-        for planet in self.planets:
-            planet.draw(surface)
-            
         # Draw stars
+        if prof:
+            prof.section("draw.stars")
+        glow = self.quality["glow"]
         for star in self.stars:
-            star.draw(surface)
+            star.draw(surface, alpha, dirty, glow)
             
         # Draw enemies
+        if prof:
+            prof.section("draw.enemies")
         for enemy in self.enemies:
-            enemy.draw(surface)
+            enemy.draw(surface, alpha, dirty)
+        if self.mode != "endless":
+            self.enemy_bullets.draw(surface, ENEMY_BULLET_SPEED, alpha, dirty)
             
         # Draw explosions
-        for explosion in self.explosions:
-            explosion.draw(surface)
+        if prof:
+            prof.section("draw.particles")
+        self.particles.draw(surface, alpha, dirty)
             
         # Draw player
-        self.player.draw(surface)
+        if prof:
+            prof.section("draw.player")
+        flame = self.ticks_ms() // PLAYER_FLAME_MS % len(PLAYER_FLAME_LENGTHS)
+        self.player.draw(surface, alpha, dirty, flame)
         
-        # Draw UI
+    def hud_key(self):
+        if self.mode == "endless":
+            return (self.player.score, self.level, self.player.collected_stars, self.endless.ticks)
+        return (self.player.score, self.level, self.player.collected_stars, self.stars_to_generate)
+        
+    def draw_hud(self, surface):
         # Draw score and level
-        score_text = font_small.render(f"Score: {self.player.score}", True, TEXT_COLOR)
-        level_text = font_small.render(f"Level: {self.level}/10", True, TEXT_COLOR)
-        stars_text = font_small.render(f"Stars: {self.player.collected_stars}/{self.stars_to_generate}", True, TEXT_COLOR)
+        score_text = render_text(get_font("small"), f"Score: {self.player.score}", TEXT_COLOR)
+        if self.mode == "endless":
+            level_text = render_text(get_font("small"), f"Wave: {self.level}", TEXT_COLOR)
+            stars_text = render_text(get_font("small"), f"Stars: {self.player.collected_stars}", TEXT_COLOR)
+            progress = self.endless.ticks % ENDLESS_WAVE_TICKS / ENDLESS_WAVE_TICKS
+        else:
+            level_text = render_text(get_font("small"), f"Level: {self.level}/10", TEXT_COLOR)
+            stars_text = render_text(get_font("small"), f"Stars: {self.player.collected_stars}/{self.stars_to_generate}", TEXT_COLOR)
+            progress = self.player.collected_stars / self.stars_to_generate
+        
+        s = render_scale
+        rects = [
+            surface.blit(score_text, (20 * s, 20 * s)),
+            surface.blit(level_text, (20 * s, 50 * s)),
+            surface.blit(stars_text, (20 * s, 80 * s)),
+        ]
+        
+        # Draw progress bar for stars (time to the next wave when endless)
+        rects.append(pygame.draw.rect(surface, (40, 40, 80), scaled_rect((WIDTH - 220, 20, 200, 20)),
+                                      border_radius=round(10 * s)))
+        progress_width = 196 * progress
+        pygame.draw.rect(surface, (100, 200, 255), scaled_rect((WIDTH - 218, 22, progress_width, 16)),
+                         border_radius=round(8 * s))
+        return rects
+    
+    def overlay_key(self):
+        # Everything an overlay screen shows, or None while playing normally
+        if self.state == "playing" and self.level_change_timer == 0:
+            return None
+        return (self.state, self.level_change_timer, self.level, self.player.score,
+                self.player.missed_stars, self.player.collected_stars, self.start_button.hovered, self.endless_button.hovered,
+                self.retry_button.hovered)
+    
+    def draw(self, surface, alpha=1.0):
+        # alpha: how far rendering is between the previous and current tick
+        prof = self.profiler
+        if prof:
+            prof.section("draw.background")
+        self.draw_background(surface)
         
-        surface.blit(score_text, (20, 20))
-        surface.blit(level_text, (20, 50))
-        surface.blit(stars_text, (20, 80))
+        # Draw planets
+        if prof:
+            prof.section("draw.planets")
+        detail = self.quality["planet_detail"]
+        for planet in self.planets:
+            planet.draw(surface, detail)
+            
+        self.draw_entities(surface, alpha)
         
-        # Draw progress bar for stars
-        pygame.draw.rect(surface, (40, 40, 80), (WIDTH - 220, 20, 200, 20), border_radius=10)
-        progress_width = 196 * (self.player.collected_stars / self.stars_to_generate)
-        pygame.draw.rect(surface, (100, 200, 255), (WIDTH - 218, 22, progress_width, 16), border_radius=8)
+        # Draw UI
+        if prof:
+            prof.section("draw.hud")
+        self.draw_hud(surface)
+        if prof:
+            prof.section("draw.overlays")
+        self.draw_overlays(surface)
+        if prof:
+            prof.end()
         
+    def draw_overlays(self, surface):
         # Draw game state overlays
         if self.state == "menu":
             self.draw_menu(surface)
@@ -617,33 +2288,58 @@ class Game:
         elif self.state == "level_complete":
             self.draw_level_complete(surface)
             
-        # Draw level transition
+        # Draw level transition, one black surface faded with its surface alpha
         if self.level_change_timer > 0:
             alpha = min(255, (LEVEL_CHANGE_DELAY - self.level_change_timer) * 4)
-            overlay = pygame.Surface((WIDTH, HEIGHT), pygame.SRCALPHA)
-            overlay.fill((0, 0, 0, alpha))
-            surface.blit(overlay, (0, 0))
+            if self.fade_surface is None or self.fade_surface.get_size() != render_size():
+                self.fade_surface = display_format(pygame.Surface(render_size()))
+                self.fade_surface.fill((0, 0, 0))
+            self.fade_surface.set_alpha(alpha)
+            surface.blit(self.fade_surface, (0, 0))
             
-            level_text = font_large.render(f"Level {self.level} Complete!", True, (255, 255, 200))
-            surface.blit(level_text, (WIDTH//2 - level_text.get_width()//2, HEIGHT//2 - 50))
+            centre = surface.get_width() // 2
+            level_text = render_text(get_font("large"), f"Level {self.level} Complete!", (255, 255, 200))
+            surface.blit(level_text, (centre - level_text.get_width()//2, (HEIGHT//2 - 50) * render_scale))
             
             if self.level < 10:
-                next_text = font_medium.render(f"Preparing for Level {self.level + 1}...", True, TEXT_COLOR)
-                surface.blit(next_text, (WIDTH//2 - next_text.get_width()//2, HEIGHT//2 + 20))
+                next_text = render_text(get_font("medium"), f"Preparing for Level {self.level + 1}...", TEXT_COLOR)
+                surface.blit(next_text, (centre - next_text.get_width()//2, (HEIGHT//2 + 20) * render_scale))
+    
+    def cached_screen(self, name, key, compose):
+        # Full-screen overlay layers are composed once and reused until
+        # whatever they show (the key) or the render size changes
+        entry = self.screens.get(name)
+        if entry is not None and entry[1].get_size() != render_size():
+            entry = None
+        if entry is None:
+            layer = pygame.Surface(render_size(), pygame.SRCALPHA)
+        elif entry[0] == key:
+            return entry[1]
+        else:
+            layer = entry[1]
+        compose(layer)
+        if entry is None:
+            layer = display_format(layer, alpha=True)
+        self.screens[name] = (key, layer)
+        return layer
     
     def draw_menu(self, surface):
+        key = (self.start_button.hovered, self.endless_button.hovered)
+        surface.blit(self.cached_screen("menu", key, self.compose_menu), (0, 0))
+    
+    def compose_menu(self, surface):
         # Draw semi-transparent overlay
-        overlay = pygame.Surface((WIDTH, HEIGHT), pygame.SRCALPHA)
-        overlay.fill((0, 0, 20, 200))
-        surface.blit(overlay, (0, 0))
+        surface.fill((0, 0, 20, 200))
         
         # Draw title
-        title_text = title_font.render("GALACTIC STAR COLLECTOR", True, (255, 255, 200))
-        surface.blit(title_text, (WIDTH//2 - title_text.get_width()//2, HEIGHT//4))
+        s = render_scale
+        centre = surface.get_width() // 2
+        title_text = render_text(get_font("title"), "GALACTIC STAR COLLECTOR", (255, 255, 200))
+        surface.blit(title_text, (centre - title_text.get_width()//2, HEIGHT//4 * s))
         
         # Draw subtitle
-        subtitle_text = font_medium.render("Collect stars per level while avoiding enemy ships", True, TEXT_COLOR)
-        surface.blit(subtitle_text, (WIDTH//2 - subtitle_text.get_width()//2, HEIGHT//4 + 80))
+        subtitle_text = render_text(get_font("medium"), "Collect stars per level while avoiding enemy ships", TEXT_COLOR)
+        surface.blit(subtitle_text, (centre - subtitle_text.get_width()//2, (HEIGHT//4 + 80) * s))
         
         # Draw instructions
         instructions = [
@@ -658,103 +2354,708 @@ class Game:
         ]
         
         for i, line in enumerate(instructions):
-            text = font_small.render(line, True, TEXT_COLOR)
-            surface.blit(text, (WIDTH//2 - text.get_width()//2, HEIGHT//2 + 20 + i*35))
+            text = render_text(get_font("small"), line, TEXT_COLOR)
+            surface.blit(text, (centre - text.get_width()//2, (HEIGHT//2 + 20 + i*35) * s))
         
-        # Draw button
+        # Draw buttons
         self.start_button.draw(surface)
+        self.endless_button.draw(surface)
     
     def draw_game_over(self, surface):
+        key = (self.mode, self.level, self.player.missed_stars > 0, self.player.score,
+               self.player.collected_stars, self.retry_button.hovered)
+        surface.blit(self.cached_screen("game_over", key, self.compose_game_over), (0, 0))
+    
+    def compose_game_over(self, surface):
         # Draw semi-transparent overlay
-        overlay = pygame.Surface((WIDTH, HEIGHT), pygame.SRCALPHA)
-        overlay.fill((0, 0, 0, 180))
-        surface.blit(overlay, (0, 0))
+        surface.fill((0, 0, 0, 180))
         
         # Draw game over text
-        if self.level > 10:
-            title_text = font_large.render("CONGRATULATIONS!", True, (100, 255, 150))
-            subtitle_text = font_medium.render("You've completed all 10 levels!", True, TEXT_COLOR)
+        if self.mode == "endless":
+            title_text = render_text(get_font("large"), "GAME OVER", (255, 100, 100))
+            subtitle_text = render_text(get_font("medium"), f"You collected {self.player.collected_stars} stars", TEXT_COLOR)
+        elif self.level > 10:
+            title_text = render_text(get_font("large"), "CONGRATULATIONS!", (100, 255, 150))
+            subtitle_text = render_text(get_font("medium"), "You've completed all 10 levels!", TEXT_COLOR)
         else:
-            title_text = font_large.render("GAME OVER", True, (255, 100, 100))
+            title_text = render_text(get_font("large"), "GAME OVER", (255, 100, 100))
             if self.player.missed_stars > 0:
-                subtitle_text = font_medium.render("You missed a star!", True, TEXT_COLOR)
+                subtitle_text = render_text(get_font("medium"), "You missed a star!", TEXT_COLOR)
             else:
-                subtitle_text = font_medium.render("You were destroyed by an enemy!", True, TEXT_COLOR)
+                subtitle_text = render_text(get_font("medium"), "You were destroyed by an enemy!", TEXT_COLOR)
         
-        surface.blit(title_text, (WIDTH//2 - title_text.get_width()//2, HEIGHT//3))
-        surface.blit(subtitle_text, (WIDTH//2 - subtitle_text.get_width()//2, HEIGHT//3 + 60))
+        s = render_scale
+        centre = surface.get_width() // 2
+        surface.blit(title_text, (centre - title_text.get_width()//2, HEIGHT//3 * s))
+        surface.blit(subtitle_text, (centre - subtitle_text.get_width()//2, (HEIGHT//3 + 60) * s))
         
         # Draw score
-        score_text = font_medium.render(f"Final Score: {self.player.score}", True, (255, 255, 200))
-        level_text = font_medium.render(f"Level Reached: {self.level}/10", True, TEXT_COLOR)
-        surface.blit(score_text, (WIDTH//2 - score_text.get_width()//2, HEIGHT//2))
-        surface.blit(level_text, (WIDTH//2 - level_text.get_width()//2, HEIGHT//2 + 50))
+        score_text = render_text(get_font("medium"), f"Final Score: {self.player.score}", (255, 255, 200))
+        if self.mode == "endless":
+            level_text = render_text(get_font("medium"), f"Wave Reached: {self.level}", TEXT_COLOR)
+        else:
+            level_text = render_text(get_font("medium"), f"Level Reached: {self.level}/10", TEXT_COLOR)
+        surface.blit(score_text, (centre - score_text.get_width()//2, HEIGHT//2 * s))
+        surface.blit(level_text, (centre - level_text.get_width()//2, (HEIGHT//2 + 50) * s))
         
         # Draw button
         self.retry_button.draw(surface)
     
-    def reset_game(self):
+    def reset_game(self, seed=None, mode=None):
+        # Every session has its own seed, by default drawn from the last one,
+        # so a Game built with a seed replays identically. mode switches
+        # between the levels and endless mode, by default it stays the same.
+        if seed is None:
+            seed = self.rng.getrandbits(63)
+        if mode is not None:
+            self.mode = mode
+        self.seed = seed
+        self.rng.seed(seed)
+        self.replay = (Replay(seed, mode=self.mode, bullets_outlive_shooter=self.bullets_outlive_shooter)
+                       if self.recording else None)
+        
+        if self.preloader:
+            self.preloader.cancel()
         self.player.reset()
-        self.stars = []
-        self.enemies = []
+        self.clear_stars()
+        self.clear_enemies()
         self.planets = []
-        self.explosions = []
+        self.particles.clear()
+        # Explosions are cosmetic but seeded too, so exports and snapshots
+        # of a session look the same every time
+        self.particles.rng = np.random.default_rng(seed)
         self.level = 1
         self.state = "playing"
         self.level_change_timer = 0
         self.generate_stars()
-        self.generate_enemies()
         self.generate_planets()
+        if self.mode == "endless":
+            self.endless.reset(self.rng.getrandbits(64))
+        else:
+            self.generate_enemies()
+
+    def snapshot(self):
+        # Everything the simulation depends on, RNG states included, as a
+        # compact buffer for restore(). Particles and planets come along so
+        # a restored game also looks the same.
+        player = self.player
+        low, high = self.star_group_size
+        return b"".join([
+            SNAPSHOT_HEADER.pack(SNAPSHOT_MAGIC, SNAPSHOT_VERSION, GAME_MODES.index(self.mode),
+                                 GAME_STATES.index(self.state), self.seed is not None,
+                                 self.bullets_outlive_shooter, self.seed or 0, self.level,
+                                 self.level_change_timer, self.stars_to_generate, self.stars_generated,
+                                 low, high, self.star_spawn_chance, self.endless.ticks),
+            SNAPSHOT_PLAYER.pack(player.x, player.y, player.prev_x, player.prev_y, player.width,
+                                 player.height, player.speed, player.score, player.collected_stars,
+                                 player.missed_stars, player.shoot_cooldown),
+            pack_random(self.rng),
+            pack_generator(self.endless.rng),
+            pack_generator(self.particles.rng),
+            player.bullets.pack(),
+            pack_entities(self.stars, Star.fields),
+            pack_entities(self.enemies, Enemy.fields),
+            self.enemy_bullets.pack(),
+            self.endless.stars.pack(),
+            self.endless.enemies.pack(),
+            self.particles.pack(),
+            pack_entities(self.planets, PLANET_FIELDS),
+        ])
+        
+    def restore(self, data):
+        # Return to a snapshot() of this game, or of another one with the
+        # same level configs. Recording stops for the current session. Bad
+        # data raises ValueError and may leave the game half restored.
+        if data[:4] != SNAPSHOT_MAGIC or data[4:5] != bytes([SNAPSHOT_VERSION]):
+            raise ValueError("not a Star Collector snapshot")
+        reader = SnapshotReader(data)
+        (magic, version, mode, state, has_seed, self.bullets_outlive_shooter, seed, self.level,
+         self.level_change_timer, self.stars_to_generate, self.stars_generated, low, high,
+         self.star_spawn_chance, self.endless.ticks) = reader.unpack(SNAPSHOT_HEADER)
+        self.mode = GAME_MODES[mode]
+        self.state = GAME_STATES[state]
+        self.seed = seed if has_seed else None
+        self.star_group_size = (low, high)
+        self.replay = None
+        
+        player = self.player
+        (player.x, player.y, player.prev_x, player.prev_y, player.width, player.height, player.speed,
+         player.score, player.collected_stars, player.missed_stars,
+         player.shoot_cooldown) = reader.unpack(SNAPSHOT_PLAYER)
+        reader.random(self.rng)
+        reader.generator(self.endless.rng)
+        reader.generator(self.particles.rng)
+        player.bullets.unpack(reader)
+        reader.entities(self.stars, self.star_pool, Star.fields)
+        reader.entities(self.enemies, self.enemy_pool, Enemy.fields)
+        if self.enemies:
+            skip_enemy_ids(max(enemy.uid for enemy in self.enemies))
+        self.enemy_bullets.unpack(reader)
+        self.endless.stars.unpack(reader)
+        self.endless.enemies.unpack(reader)
+        if self.endless.enemies.count:
+            skip_enemy_ids(int(self.endless.enemies.uid[:self.endless.enemies.count].max()))
+        self.particles.unpack(reader)
+        count, columns = reader.columns([dtype for name, dtype in PLANET_FIELDS])
+        self.planets = [Planet(*values) for values in zip(*[column.tolist() for column in columns])]
+        if reader.offset != len(data):
+            raise ValueError("snapshot has trailing data")
+        
+    def clone(self):
+        # An independent copy of the simulation for look-ahead and rollback,
+        # without going through bytes. Caches and UI are shared, and the
+        # clone has no profiler, preloader or recording.
+        clone = copy.copy(self)
+        clone.rng = random.Random()
+        clone.rng.setstate(self.rng.getstate())
+        clone.player = self.player.copy()
+        clone.stars = [copy_entity(star) for star in self.stars]
+        clone.enemies = [copy_entity(enemy) for enemy in self.enemies]
+        clone.planets = [copy.copy(planet) for planet in self.planets]
+        clone.particles = self.particles.copy()
+        clone.enemy_bullets = self.enemy_bullets.copy()
+        clone.endless = self.endless.copy(clone.enemy_bullets)
+        clone.collisions = CollisionSystem()
+        clone.star_pool = EntityPool(Star)
+        clone.enemy_pool = EntityPool(Enemy)
+        clone.level_configs = list(self.level_configs)
+        clone.screens = {}
+        clone.profiler = None
+        clone.preloader = None
+        clone.recording = False
+        clone.replay = None
+        return clone
+
+# Replays: a session's seed, one key bitmask per tick and the outcome
+REPLAY_MAGIC = b"SCRP"
+REPLAY_VERSION = 3
+# magic, version, seed, ticks, score, level, state, mode, bullets outlive shooter
+REPLAY_HEADER = struct.Struct("<4sBQIIHBB?")
+REPLAY_HEADER_V2 = struct.Struct("<4sBQIIHBB")  # without the bullet flag
+REPLAY_HEADER_V1 = struct.Struct("<4sBQIIHB")  # without the mode, always the levels game
+GAME_STATES = ("menu", "playing", "level_complete", "game_over")
+GAME_MODES = ("levels", "endless")
+
+class Replay:
+    def __init__(self, seed, masks=b"", score=0, level=1, state="playing", finished=False, mode="levels",
+                 bullets_outlive_shooter=False):
+        self.seed = seed
+        self.mode = mode
+        self.bullets_outlive_shooter = bullets_outlive_shooter
+        self.masks = bytearray(masks)
+        self.score = score
+        self.level = level
+        self.state = state
+        self.finished = finished
+        
+    def record(self, mask):
+        self.masks.append(mask)
+        
+    def finish(self, game):
+        self.score = game.player.score
+        self.level = game.level
+        self.state = game.state
+        self.bullets_outlive_shooter = game.bullets_outlive_shooter
+        self.finished = True
+        
+    def to_bytes(self):
+        header = REPLAY_HEADER.pack(REPLAY_MAGIC, REPLAY_VERSION, self.seed, len(self.masks),
+                                    self.score, self.level, GAME_STATES.index(self.state),
+                                    GAME_MODES.index(self.mode), self.bullets_outlive_shooter)
+        # Held keys repeat for many ticks, so the masks compress very well
+        return header + zlib.compress(bytes(self.masks), 9)
+        
+    @classmethod
+    def from_bytes(cls, data):
+        magic, version = data[:4], data[4] if len(data) > 4 else None
+        if magic != REPLAY_MAGIC or version not in (1, 2, REPLAY_VERSION):
+            raise ValueError("not a Star Collector replay")
+        if len(data) < (REPLAY_HEADER_V1, REPLAY_HEADER_V2, REPLAY_HEADER)[version - 1].size:
+            raise ValueError("replay is truncated")
+        if version == 1:
+            header = REPLAY_HEADER_V1
+            magic, version, seed, ticks, score, level, state = header.unpack_from(data)
+            mode = 0
+        elif version == 2:
+            header = REPLAY_HEADER_V2
+            magic, version, seed, ticks, score, level, state, mode = header.unpack_from(data)
+        else:
+            header = REPLAY_HEADER
+            magic, version, seed, ticks, score, level, state, mode, outlive = header.unpack_from(data)
+        if version < 3:
+            # Endless bullets had no owner and were never removed with their
+            # enemy, which is what the flag does now
+            outlive = GAME_MODES[mode] == "endless"
+        try:
+            masks = zlib.decompress(data[header.size:])
+        except zlib.error:
+            raise ValueError("replay is truncated")
+        if len(masks) != ticks:
+            raise ValueError("replay is truncated")
+        return cls(seed, masks, score, level, GAME_STATES[state], finished=True, mode=GAME_MODES[mode],
+                   bullets_outlive_shooter=outlive)
+        
+    def save(self, path):
+        with open(path, "wb") as f:
+            f.write(self.to_bytes())
+            
+    @classmethod
+    def load(cls, path):
+        with open(path, "rb") as f:
+            return cls.from_bytes(f.read())
+
+# Snapshots: the whole simulation as bytes, see Game.snapshot. Drawing state
+# (caches, background, buttons) and the replay being recorded are left out.
+SNAPSHOT_MAGIC = b"SCSS"
+SNAPSHOT_VERSION = 2
+# magic, version, mode, state, has seed, bullets outlive shooter, seed, level,
+# level change timer, stars to generate, stars generated, star group size,
+# star spawn chance, endless ticks
+SNAPSHOT_HEADER = struct.Struct("<4sBBB??QIiIIIIdQ")
+# x, y, prev_x, prev_y, width, height, speed, score, collected, missed, shot cooldown
+SNAPSHOT_PLAYER = struct.Struct("<ddddiidqIIi")
+SNAPSHOT_RANDOM = struct.Struct("<B?d")  # Mersenne Twister version, then gauss_next if set
+SNAPSHOT_RANDOM_WORDS = 625  # Mersenne Twister state words, the last one is the position
+SNAPSHOT_PCG64 = struct.Struct("<QQQQBI")  # state and increment as 64-bit halves, buffered uint32
+SNAPSHOT_COUNT = struct.Struct("<I")
+PLANET_FIELDS = (("level", np.int32), ("x", np.int32), ("y", np.int32), ("rotation", np.float64))
+
+def pack_columns(count, columns):
+    # A count followed by each column's raw values
+    return SNAPSHOT_COUNT.pack(count) + b"".join(bytes(column) for column in columns)
+
+def pack_entities(items, fields):
+    return pack_columns(len(items), [np.fromiter((getattr(item, name) for item in items), dtype, len(items))
+                                     for name, dtype in fields])
+
+def pack_random(rng):
+    version, words, gauss = rng.getstate()
+    return SNAPSHOT_RANDOM.pack(version, gauss is not None, gauss or 0.0) + array("I", words).tobytes()
+
+def pack_generator(rng):
+    state = rng.bit_generator.state
+    mask = (1 << 64) - 1
+    value, inc = state["state"]["state"], state["state"]["inc"]
+    return SNAPSHOT_PCG64.pack(value & mask, value >> 64, inc & mask, inc >> 64,
+                               state["has_uint32"], state["uinteger"])
 
-# Create game instance
-game = Game()
-clock = pygame.time.Clock()
-
-# Main game loop
-running = True
-while running:
-    mouse_pos = pygame.mouse.get_pos()
-    
-    # Handle events
-    for event in pygame.event.get():
-        if event.type == QUIT:
-            running = False
-            
-        # Handle button clicks
-        if game.state == "menu":
-            game.start_button.check_hover(mouse_pos)
-            if game.start_button.is_clicked(mouse_pos, event):
-                game.reset_game()
+class SnapshotReader:
+    def __init__(self, data):
+        self.data = data
+        self.offset = 0
+        
+    # Every read raises ValueError when the data runs out
+    def unpack(self, layout):
+        try:
+            values = layout.unpack_from(self.data, self.offset)
+        except struct.error:
+            raise ValueError("snapshot is truncated")
+        self.offset += layout.size
+        return values
+        
+    def raw(self, size):
+        chunk = self.data[self.offset:self.offset + size]
+        if len(chunk) != size:
+            raise ValueError("snapshot is truncated")
+        self.offset += size
+        return chunk
+        
+    def columns(self, dtypes):
+        # (count, one read-only array per dtype) as written by pack_columns
+        (count,) = self.unpack(SNAPSHOT_COUNT)
+        columns = []
+        for dtype in dtypes:
+            try:
+                column = np.frombuffer(self.data, dtype, count, self.offset)
+            except ValueError:
+                raise ValueError("snapshot is truncated")
+            self.offset += column.nbytes
+            columns.append(column)
+        return count, columns
+        
+    def random(self, rng):
+        version, has_gauss, gauss = self.unpack(SNAPSHOT_RANDOM)
+        words = array("I", self.raw(SNAPSHOT_RANDOM_WORDS * 4))
+        rng.setstate((version, tuple(words), gauss if has_gauss else None))
+        
+    def generator(self, rng):
+        value_low, value_high, inc_low, inc_high, has_uint32, uinteger = self.unpack(SNAPSHOT_PCG64)
+        rng.bit_generator.state = {
+            "bit_generator": "PCG64",
+            "state": {"state": value_low | value_high << 64, "inc": inc_low | inc_high << 64},
+            "has_uint32": has_uint32,
+            "uinteger": uinteger,
+        }
+        
+    def entities(self, items, pool, fields):
+        # Refill items in place, recycling its old entities through pool
+        count, columns = self.columns([dtype for name, dtype in fields])
+        for item in items:
+            pool.release(item)
+        items.clear()
+        names = [name for name, dtype in fields]
+        for values in zip(*[column.tolist() for column in columns]):
+            item = pool.acquire_blank()
+            for name, value in zip(names, values):
+                setattr(item, name, value)
+            items.append(item)
+
+def skip_enemy_ids(top):
+    # Keep ids handed out from now on above the restored ones
+    global enemy_ids
+    if next(enemy_ids) <= top:
+        enemy_ids = itertools.count(top + 1)
+
+def play_replay(replay):
+    # Re-simulate a recorded session uncapped, without drawing
+    game = Game()
+    game.bullets_outlive_shooter = replay.bullets_outlive_shooter
+    game.reset_game(replay.seed, replay.mode)
+    step = game.step
+    for mask in replay.masks:
+        step(mask)
+    return game
+
+def verify_replay(path):
+    replay = Replay.load(path)
+    game = play_replay(replay)
+    expected = (replay.score, replay.level, replay.state)
+    actual = (game.player.score, game.level, game.state)
+    return path, expected == actual, expected, actual
+
+def verify_replays(paths, jobs=None):
+    if jobs == 1 or len(paths) == 1:
+        return [verify_replay(path) for path in paths]
+    with multiprocessing.Pool(jobs) as pool:
+        return pool.map(verify_replay, paths, chunksize=max(1, len(paths) // 64))
+
+def numbered_path(path, number):
+    # replay.rep, replay-2.rep, replay-3.rep, ...
+    if number == 1:
+        return path
+    stem, dot, ext = path.rpartition(".")
+    if not dot:
+        return f"{path}-{number}"
+    return f"{stem}-{number}.{ext}"
+
+# Scripted input for headless runs
+def idle_script(game, frame):
+    return 0
+
+def seek_script(game, frame):
+    # Steer towards the nearest star and keep firing
+    player = game.player
+    mask = INPUT_SHOOT
+    target = None
+    if game.mode == "endless":
+        target = game.endless.nearest_star(player.x, player.y)
+    else:
+        targets = [star for star in game.stars if not star.collected and star.y > 0]
+        if targets:
+            star = min(targets, key=lambda star: abs(star.x - player.x) + abs(star.y - player.y))
+            target = (star.x, star.y)
+    if target is not None:
+        x, y = target
+        if x < player.x - PLAYER_SPEED:
+            mask |= INPUT_LEFT
+        elif x > player.x + PLAYER_SPEED:
+            mask |= INPUT_RIGHT
+        if y < player.y - PLAYER_SPEED:
+            mask |= INPUT_UP
+        elif y > player.y + PLAYER_SPEED:
+            mask |= INPUT_DOWN
+    return mask
+
+def sequence_script(masks):
+    def script(game, frame):
+        return masks[frame] if frame < len(masks) else 0
+    return script
+
+def load_input_script(path):
+    # One integer key bitmask per line, one line per frame
+    with open(path) as f:
+        return sequence_script([int(line) for line in f if line.strip()])
+
+SCRIPTS = {
+    "idle": idle_script,
+    "seek": seek_script,
+}
+
+def run_headless(frames, script=idle_script, restart=False, game=None, seed=None, record_path=None):
+    # Step Game.update as fast as possible, never drawing. With record_path
+    # every session is saved as a replay, numbered as in the window.
+    if game is None:
+        game = Game(seed)
+    game.recording = game.recording or record_path is not None
+    game.reset_game()
+    steps = 0
+    sessions = 0
+    prof = game.profiler
+    while steps < frames:
+        if prof:
+            prof.begin_frame()
+        game.step(script(game, steps))
+        if prof:
+            prof.end_frame()
+        steps += 1
+        if game.state == "game_over":
+            if not restart:
+                break
+            if record_path is not None:
+                sessions += 1
+                game.replay.save(numbered_path(record_path, sessions))
+            game.reset_game()
+    
+    # The last session, finished or cut off by the frame limit
+    if record_path is not None and game.replay is not None:
+        if not game.replay.finished:
+            game.replay.finish(game)
+        game.replay.save(numbered_path(record_path, sessions + 1))
+    return game, steps
+
+def run_game(dirty_rects=False, record_path=None, seed=None, profile_path=None, profile_format=None,
+             show_startup=False, quality="auto", quality_report=None, scale=1.0,
+             window_size=(WIDTH, HEIGHT), smooth=True):
+    window = init_display(window_size, resizable=True)
+    target = RenderTarget(window, scale, smooth)
+    
+    # Create game instance
+    start = time.perf_counter()
+    game = Game(seed)
+    startup_times["game"] = time.perf_counter() - start
+    game.recording = record_path is not None
+    sessions = 0
+    clock = pygame.time.Clock()
+    renderer = DirtyRenderer() if dirty_rects else None
+    
+    # F3 toggles the profiler overlay; --profile keeps every frame for export
+    if profile_path:
+        game.profiler = FrameProfiler(history=None)
+    show_profiler = False
+    game.preloader = LevelPreloader()
+    quick_save = None  # F5 snapshot, restored with F9
+    
+    # "auto" lets the governor pick the tier from recent frame times
+    governor = None
+    if quality == "auto":
+        governor = QualityGovernor()
+    else:
+        game.set_quality([tier["name"] for tier in QUALITY_TIERS].index(quality))
+    
+    # Simulation runs in fixed ticks, rendering takes whatever time is left
+    tick = 1.0 / FPS
+    accumulator = 0.0
+    previous = time.perf_counter()
+    
+    # Main game loop
+    running = True
+    first_frame = time.perf_counter()
+    while running:
+        prof = game.profiler
+        if prof:
+            prof.begin_frame()
+            prof.section("events")
+        now = time.perf_counter()
+        # Past the catch-up limit the game slows down instead of spiralling
+        accumulator = min(accumulator + now - previous, tick * MAX_CATCHUP_TICKS)
+        previous = now
+        
+        mouse_pos = target.to_world(pygame.mouse.get_pos())
+        
+        # Handle events
+        for event in pygame.event.get():
+            if event.type == QUIT:
+                running = False
+            elif event.type == VIDEORESIZE:
+                target.resize(pygame.display.get_surface())
+                if renderer:
+                    renderer.invalidate()
+            elif event.type in (VIDEOEXPOSE, WINDOWEXPOSED):
+                target.full = True
+                if renderer:
+                    renderer.invalidate()
+            elif event.type == KEYDOWN and event.key == K_F3:
+                show_profiler = not show_profiler
+                if show_profiler and game.profiler is None:
+                    game.profiler = FrameProfiler()
+                elif not show_profiler and not profile_path:
+                    game.profiler = None
+                if renderer:
+                    renderer.invalidate()
+            elif event.type == KEYDOWN and event.key == K_F5 and game.state != "menu":
+                quick_save = game.snapshot()
+            elif event.type == KEYDOWN and event.key == K_F9 and quick_save is not None:
+                game.restore(quick_save)
+                if renderer:
+                    renderer.invalidate()
                 
-        elif game.state == "game_over":
-            game.retry_button.check_hover(mouse_pos)
-            if game.retry_button.is_clicked(mouse_pos, event):
-                game.reset_game()
+            # Handle button clicks
+            if game.state == "menu":
+                game.start_button.check_hover(mouse_pos)
+                game.endless_button.check_hover(mouse_pos)
+                if game.start_button.is_clicked(mouse_pos, event):
+                    game.reset_game(mode="levels")
+                elif game.endless_button.is_clicked(mouse_pos, event):
+                    game.reset_game(mode="endless")
+                    
+            elif game.state == "game_over":
+                game.retry_button.check_hover(mouse_pos)
+                if game.retry_button.is_clicked(mouse_pos, event):
+                    game.reset_game()
+        
+        # Handle player input and update game state
+        mask = read_keyboard()
+        while accumulator >= tick:
+            game.step(mask)
+            accumulator -= tick
+            
+        # Save each finished session, one file per session
+        replay = game.replay
+        if replay is not None and replay.finished:
+            sessions += 1
+            replay.save(numbered_path(record_path, sessions))
+            game.replay = None
+        
+        # Draw everything and update the display
+        rects = None
+        if renderer:
+            rects = renderer.draw(game, target.surface, accumulator / tick)
+        else:
+            game.draw(target.surface, accumulator / tick)
+        if prof:
+            prof.section("present")
+        rects = target.present(rects)
+        if show_profiler and game.profiler:
+            # Drawn on the window itself, so it stays sharp at any scale
+            game.profiler.section("profiler")
+            overlay_rects = game.profiler.draw(target.window)
+            if rects is not None:
+                rects = rects + overlay_rects
+            if prof:
+                prof.section("present")
+        
+        if rects is None:
+            pygame.display.flip()
+        elif rects:
+            pygame.display.update(rects)
+        if first_frame:
+            startup_times["first frame"] = time.perf_counter() - first_frame
+            first_frame = None
+            if show_startup:
+                print(startup_report())
+        elif governor:
+            game.set_quality(governor.record((time.perf_counter() - now) * 1000.0))
+        if prof:
+            prof.section("idle")
+        clock.tick(RENDER_FPS_LIMIT)
+        if prof:
+            prof.end_frame()
     
-    # Handle player input
-    keys = pygame.key.get_pressed()
-    if game.state == "playing":
-        if keys[K_LEFT]:
-            game.player.move("left")
-        if keys[K_RIGHT]:
-            game.player.move("right")
-        # Add vertical movement controls
-        if keys[K_UP]:
-            game.player.move("up")
-        if keys[K_DOWN]:
-            game.player.move("down")
-        if keys[K_SPACE]:
-            game.player.shoot()
-    
-    # Update game state
-    game.update()
-    
-    # Draw everything
-    game.draw(screen)
-    
-    # Update the display
-    pygame.display.flip()
-    clock.tick(FPS)
-
-pygame.quit()
-sys.exit()
\ No newline at end of file
+    # Keep the session that was still in progress when the window closed
+    if game.replay is not None:
+        game.replay.finish(game)
+        game.replay.save(numbered_path(record_path, sessions + 1))
+    if profile_path:
+        game.profiler.export(profile_path, profile_format)
+    
+    if governor and quality_report:
+        with open(quality_report, "w") as f:
+            json.dump(governor.metrics(), f, indent=2)
+    game.preloader.close()
+    pygame.quit()
+
+def parse_size(text):
+    try:
+        width, height = (int(part) for part in text.lower().split("x"))
+    except ValueError:
+        raise argparse.ArgumentTypeError(f"expected WIDTHxHEIGHT, got {text!r}")
+    return width, height
+
+def parse_render_scale(text):
+    try:
+        scale = float(text)
+    except ValueError:
+        raise argparse.ArgumentTypeError(f"expected a number, got {text!r}")
+    if not 0 < scale < math.inf:
+        raise argparse.ArgumentTypeError(f"render scale must be positive and finite, got {text!r}")
+    return max(scale, MIN_RENDER_SCALE)
+
+def parse_args(argv=None):
+    parser = argparse.ArgumentParser(description="Galactic Star Collector")
+    parser.add_argument("--dirty-rects", action="store_true",
+                        help="redraw and present only the screen areas that changed")
+    parser.add_argument("--headless", action="store_true",
+                        help="simulate without a window, as fast as possible")
+    parser.add_argument("--frames", type=int, default=100000,
+                        help="frames to simulate in headless mode")
+    parser.add_argument("--script", choices=sorted(SCRIPTS), default="seek",
+                        help="built-in input script for headless mode")
+    parser.add_argument("--input", metavar="FILE",
+                        help="file of per-frame key bitmasks for headless mode")
+    parser.add_argument("--endless", action="store_true",
+                        help="play endless mode in headless runs")
+    parser.add_argument("--restart", action="store_true",
+                        help="start a new game after game over in headless mode")
+    parser.add_argument("--seed", type=int,
+                        help="seed for the gameplay random stream")
+    parser.add_argument("--record", metavar="FILE",
+                        help="save each played session as a replay (FILE, FILE-2, ...)")
+    parser.add_argument("--verify", metavar="REPLAY", nargs="+",
+                        help="re-simulate replays and check their final score, level and state")
+    parser.add_argument("--jobs", type=int,
+                        help="worker processes for --verify (default: one per core)")
+    parser.add_argument("--quality", choices=("auto",) + tuple(tier["name"] for tier in QUALITY_TIERS),
+                        default="auto", help="visual quality tier, auto adapts it to the frame time")
+    parser.add_argument("--render-scale", type=parse_render_scale, default=1.0,
+                        help="draw at this fraction of the window resolution and scale up, e.g. 0.5")
+    parser.add_argument("--window", type=parse_size, default=(WIDTH, HEIGHT), metavar="WxH",
+                        help=f"initial window size (default: {WIDTH}x{HEIGHT}), the window can be resized")
+    parser.add_argument("--nearest", action="store_true",
+                        help="scale with nearest neighbour instead of smoothscale: faster, but blocky")
+    parser.add_argument("--quality-report", metavar="FILE",
+                        help="write the quality governor's tier changes as JSON on exit")
+    parser.add_argument("--startup-times", action="store_true",
+                        help="print how long each startup phase took once the first frame is shown")
+    parser.add_argument("--profile", metavar="FILE",
+                        help="time every update and draw phase and export the frames to FILE")
+    parser.add_argument("--profile-format", choices=("json", "csv", "trace"),
+                        help="export format for --profile: json, csv or Chrome trace events "
+                             "(default: csv for .csv files, otherwise json)")
+    return parser.parse_args(argv)
+
+def main(argv=None):
+    args = parse_args(argv)
+    if args.verify:
+        failed = 0
+        for path, ok, expected, actual in verify_replays(args.verify, args.jobs):
+            if not ok:
+                failed += 1
+                print(f"FAIL {path}: expected {expected}, got {actual}")
+        print(f"{len(args.verify) - failed}/{len(args.verify)} replays match")
+        return 1 if failed else 0
+    
+    if not args.headless:
+        run_game(args.dirty_rects, args.record, args.seed, args.profile, args.profile_format, args.startup_times,
+                 args.quality, args.quality_report, args.render_scale, args.window, not args.nearest)
+        return 0
+    
+    script = load_input_script(args.input) if args.input else SCRIPTS[args.script]
+    start = time.perf_counter()
+    game = Game(args.seed)
+    game.recording = args.record is not None
+    if args.endless:
+        game.mode = "endless"
+    if args.profile:
+        game.profiler = FrameProfiler(history=None)
+    game, steps = run_headless(args.frames, script, args.restart, game, record_path=args.record)
+    elapsed = time.perf_counter() - start
+    if args.profile:
+        game.profiler.export(args.profile, args.profile_format)
+    print(f"frames: {steps}  time: {elapsed:.3f}s  fps: {steps / max(elapsed, 1e-9):.0f}")
+    print(f"score: {game.player.score}  level: {game.level}  state: {game.state}")
+    return 0
+
+startup_times["imports"] = time.perf_counter() - IMPORT_START
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,47 @@
+# Delta-compressed state messages against the authoritative game
+import random
+import numpy as np
+import pytest
+import server
+import starcollector as sc
+
+@pytest.mark.parametrize("mode", sc.GAME_MODES)
+def test_client_tracks_a_live_session(mode):
+    # Some states are lost and acks lag behind, so deltas come from many
+    # different bases; after every state the client holds must match the game
+    session = server.Session(1, None, mode, 11)
+    client = server.Client()
+    rng = random.Random(11)
+    mask = 0
+    for tick in range(1, 1500):
+        if tick % 20 == 1:
+            mask = rng.getrandbits(5) | sc.INPUT_SHOOT
+        game = session.game
+        if game.state == "game_over":
+            game.reset_game()
+        game.step(mask)
+        message = session.state_message(tick)
+        if tick % 7 == 3:
+            continue
+        client.apply(message)
+        assert client.header == server.STATE.unpack(server.state_header(game, tick, client.header[2]))
+        for name, table, expected in zip(server.ENTITY_KINDS, client.tables, server.world_tables(game)):
+            assert np.array_equal(table, expected), name
+        if tick % 3:
+            session.ack = client.tick
+
+def test_encode_decode_kind_round_trip():
+    rng = np.random.default_rng(0)
+    base = None
+    for _ in range(200):
+        table = rng.integers(-5, 5, (int(rng.integers(0, 30)), 3)).astype(np.int16)
+        data = server.encode_kind(table, base)
+        decoded, offset = server.decode_kind(data, 0, base, 3)
+        assert offset == len(data)
+        assert np.array_equal(decoded, table)
+        base = table
+
+def test_unchanged_table_sends_no_rows():
+    table = np.arange(12, dtype=np.int16).reshape(4, 3)
+    data = server.encode_kind(table, table.copy())
+    assert data == server.KIND.pack(4, 0)
@@ -0,0 +1,127 @@
+# Round trips of the binary snapshot and replay formats
+import random
+import pytest
+import starcollector as sc
+
+def play(game, ticks, seed):
+    # Random keys held for a while, firing often, with a new session on game over
+    rng = random.Random(seed)
+    mask = 0
+    for tick in range(ticks):
+        if tick % 20 == 0:
+            mask = rng.getrandbits(5)
+        if game.state == "game_over":
+            game.reset_game()
+        game.step(mask)
+
+def state(game):
+    # Everything the simulation decides. Entity ids come from a process-wide
+    # counter and new planets are placed with the module generator, so ids
+    # and planet positions are left out.
+    player = game.player
+    endless = game.endless
+    return (
+        game.mode, game.state, game.level, game.level_change_timer, game.stars_generated,
+        player.x, player.y, player.score, player.collected_stars, player.missed_stars, player.shoot_cooldown,
+        list(player.bullets),
+        [(star.x, star.y, star.collected) for star in game.stars],
+        [(enemy.x, enemy.y, enemy.alive, enemy.shoot_timer) for enemy in game.enemies],
+        game.enemy_bullets.x[:game.enemy_bullets.count].tolist(),
+        game.enemy_bullets.y[:game.enemy_bullets.count].tolist(),
+        endless.ticks,
+        endless.stars.x[:endless.stars.count].tolist(),
+        endless.enemies.y[:endless.enemies.count].tolist(),
+        game.particles.count,
+        [(planet.level, planet.rotation) for planet in game.planets],
+        game.rng.getstate(),
+    )
+
+@pytest.fixture(params=sc.GAME_MODES)
+def game(request):
+    game = sc.Game(3)
+    game.reset_game(3, request.param)
+    play(game, 900, 1)
+    return game
+
+def test_restore_gives_the_same_snapshot(game):
+    data = game.snapshot()
+    other = sc.Game()
+    other.restore(data)
+    assert other.snapshot() == data
+    assert state(other) == state(game)
+
+def test_restored_game_plays_on_identically(game):
+    other = sc.Game()
+    other.restore(game.snapshot())
+    play(game, 600, 2)
+    play(other, 600, 2)
+    assert state(other) == state(game)
+
+def test_clone_plays_on_identically(game):
+    other = game.clone()
+    play(game, 600, 2)
+    play(other, 600, 2)
+    assert state(other) == state(game)
+
+def test_truncated_snapshot_is_rejected(game):
+    data = game.snapshot()
+    other = sc.Game()
+    for size in list(range(0, len(data), 5)) + [len(data) - 1]:
+        with pytest.raises(ValueError):
+            other.restore(data[:size])
+    with pytest.raises(ValueError):
+        other.restore(data + b"\0")
+
+def test_wrong_snapshot_version_is_rejected(game):
+    data = game.snapshot()
+    with pytest.raises(ValueError):
+        sc.Game().restore(data[:4] + bytes([sc.SNAPSHOT_VERSION + 1]) + data[5:])
+    with pytest.raises(ValueError):
+        sc.Game().restore(b"XXXX" + data[4:])
+
+def recorded(mode, outlive=False):
+    game = sc.Game(5)
+    game.recording = True
+    game.reset_game(5, mode)
+    game.bullets_outlive_shooter = outlive
+    rng = random.Random(5)
+    mask = 0
+    for tick in range(3000):
+        if game.state == "game_over":
+            break
+        if tick % 20 == 0:
+            mask = rng.getrandbits(5)
+        game.step(mask)
+    game.replay.finish(game)
+    return game, game.replay
+
+@pytest.mark.parametrize("mode", sc.GAME_MODES)
+@pytest.mark.parametrize("outlive", [False, True])
+def test_replay_round_trip(mode, outlive):
+    game, replay = recorded(mode, outlive)
+    loaded = sc.Replay.from_bytes(replay.to_bytes())
+    assert (loaded.seed, loaded.mode, bytes(loaded.masks), loaded.bullets_outlive_shooter) == \
+           (replay.seed, mode, bytes(replay.masks), outlive)
+    assert (loaded.score, loaded.level, loaded.state) == (game.player.score, game.level, game.state)
+    played = sc.play_replay(loaded)
+    assert state(played) == state(game)
+
+def test_truncated_replay_is_rejected():
+    data = recorded("levels")[1].to_bytes()
+    for size in range(len(data)):
+        with pytest.raises(ValueError):
+            sc.Replay.from_bytes(data[:size])
+
+def test_wrong_replay_version_is_rejected():
+    data = recorded("levels")[1].to_bytes()
+    with pytest.raises(ValueError):
+        sc.Replay.from_bytes(data[:4] + bytes([sc.REPLAY_VERSION + 1]) + data[5:])
+
+def test_version_2_endless_replay_keeps_its_bullets():
+    # Endless bullets outlived their enemy before the flag was stored
+    masks = bytes(range(32)) * 4
+    for mode, outlive in (("levels", False), ("endless", True)):
+        header = sc.REPLAY_HEADER_V2.pack(sc.REPLAY_MAGIC, 2, 9, len(masks), 0, 1,
+                                          sc.GAME_STATES.index("playing"), sc.GAME_MODES.index(mode))
+        replay = sc.Replay.from_bytes(header + sc.zlib.compress(masks))
+        assert (replay.mode, replay.bullets_outlive_shooter, bytes(replay.masks)) == (mode, outlive, masks)
@@ -0,0 +1,278 @@
+# Vectorised environments for training and evaluating bots
+#
+# VecEnv steps N independent Game instances at once, split into shards that
+# run in worker processes. Observations, rewards, done flags and actions live
+# in one shared-memory block, so a step only sends a short command to each
+# worker and no arrays are pickled. Actions are INPUT_* key bitmasks (0-31).
+#
+#   env = VecEnv(64, workers=8, seed=0)
+#   obs = env.reset()
+#   obs, rewards, dones, infos = env.step(actions)
+#   env.close()
+#
+# Finished episodes are reset automatically: the returned observation is the
+# first one of the next episode and infos holds the final score and level.
+import os
+os.environ.setdefault("PYGAME_HIDE_SUPPORT_PROMPT", "1")
+
+import sys
+import time
+import argparse
+import multiprocessing
+from multiprocessing import shared_memory
+import numpy as np
+import starcollector as sc
+
+# Observation layout, one float32 row per environment:
+#   player x, y, shot cooldown, level, star progress, level transition flag
+#   then (dx, dy, present) for the nearest stars, enemies and enemy bullets,
+#   relative to the player and scaled by the screen size; unused slots are 0
+OBS_STARS = 8
+OBS_ENEMIES = 8
+OBS_BULLETS = 16
+PLAYER_FEATURES = 6
+OBS_SIZE = PLAYER_FEATURES + 3 * (OBS_STARS + OBS_ENEMIES + OBS_BULLETS)
+NUM_ACTIONS = 32
+
+def buffer_layout(num_envs):
+    # (name, dtype, shape) of every shared array, packed in this order
+    return [
+        ("obs", np.float32, (num_envs, OBS_SIZE)),
+        ("rewards", np.float32, (num_envs,)),
+        ("dones", np.bool_, (num_envs,)),
+        ("actions", np.int32, (num_envs,)),
+        ("final_scores", np.int64, (num_envs,)),
+        ("final_levels", np.int32, (num_envs,)),
+        ("final_won", np.bool_, (num_envs,)),
+    ]
+
+def buffer_size(num_envs):
+    size = 0
+    for name, dtype, shape in buffer_layout(num_envs):
+        size += -size % 8 + int(np.prod(shape)) * np.dtype(dtype).itemsize
+    return size
+
+def attach(buffer, num_envs):
+    # Numpy views onto a shared-memory buffer, keyed by name
+    arrays = {}
+    offset = 0
+    for name, dtype, shape in buffer_layout(num_envs):
+        offset += -offset % 8
+        arrays[name] = np.ndarray(shape, dtype=dtype, buffer=buffer, offset=offset)
+        offset += arrays[name].nbytes
+    return arrays
+
+def nearest(px, py, points, count, out):
+    # Write (dx, dy, 1) for the count points closest to the player
+    if len(points) > count:
+        points.sort(key=lambda p: (p[0] - px) ** 2 + (p[1] - py) ** 2)
+    for k, (x, y) in enumerate(points[:count]):
+        out[3 * k] = (x - px) / sc.WIDTH
+        out[3 * k + 1] = (y - py) / sc.HEIGHT
+        out[3 * k + 2] = 1.0
+
+def observe(game, out):
+    out.fill(0.0)
+    player = game.player
+    px, py = player.x, player.y
+    out[0] = px / sc.WIDTH
+    out[1] = py / sc.HEIGHT
+    out[2] = max(player.shoot_cooldown, 0) / sc.BULLET_COOLDOWN
+    out[3] = game.level / len(game.level_configs)
+    out[4] = player.collected_stars / max(game.stars_to_generate, 1)
+    out[5] = 1.0 if game.level_change_timer > 0 else 0.0
+
+    start = PLAYER_FEATURES
+    nearest(px, py, [(star.x, star.y) for star in game.stars], OBS_STARS, out[start:])
+    start += 3 * OBS_STARS
+    nearest(px, py, [(enemy.x, enemy.y) for enemy in game.enemies], OBS_ENEMIES, out[start:])
+    start += 3 * OBS_ENEMIES
+    bullets = game.enemy_bullets
+    n = bullets.count
+    nearest(px, py, list(zip(bullets.x[:n].tolist(), bullets.y[:n].tolist())), OBS_BULLETS, out[start:])
+
+class EnvShard:
+    # The games for one contiguous slice of environments, reading actions from
+    # and writing results to the shared arrays
+    def __init__(self, start, stop, arrays, seed=None):
+        self.start = start
+        self.arrays = arrays
+        self.games = [sc.Game(None if seed is None else seed + i) for i in range(start, stop)]
+
+    def reset(self):
+        obs = self.arrays["obs"]
+        for i, game in enumerate(self.games, self.start):
+            game.reset_game()
+            observe(game, obs[i])
+        self.arrays["rewards"][self.start:self.start + len(self.games)] = 0.0
+        self.arrays["dones"][self.start:self.start + len(self.games)] = False
+
+    def step(self):
+        arrays = self.arrays
+        obs = arrays["obs"]
+        actions = arrays["actions"]
+        rewards = arrays["rewards"]
+        dones = arrays["dones"]
+        for i, game in enumerate(self.games, self.start):
+            before = game.player.score
+            game.step(int(actions[i]))
+            rewards[i] = game.player.score - before
+            done = game.state == "game_over"
+            dones[i] = done
+            if done:
+                arrays["final_scores"][i] = game.player.score
+                arrays["final_levels"][i] = game.level
+                arrays["final_won"][i] = game.level > len(game.level_configs)
+                game.reset_game()
+            observe(game, obs[i])
+
+def worker(conn, shm_name, num_envs, start, stop, seed):
+    shm = shared_memory.SharedMemory(name=shm_name)
+    shard = None
+    try:
+        shard = EnvShard(start, stop, attach(shm.buf, num_envs), seed)
+        while True:
+            command = conn.recv()
+            if command == "step":
+                shard.step()
+            elif command == "reset":
+                shard.reset()
+            elif command == "close":
+                break
+            conn.send(None)
+    except KeyboardInterrupt:
+        pass
+    finally:
+        del shard
+        shm.close()
+        conn.close()
+
+def shard_bounds(num_envs, shards):
+    # Contiguous slices whose sizes differ by at most one
+    bounds = []
+    start = 0
+    for k in range(shards):
+        stop = start + num_envs // shards + (k < num_envs % shards)
+        bounds.append((start, stop))
+        start = stop
+    return bounds
+
+class VecEnv:
+    def __init__(self, num_envs, workers=None, seed=None):
+        # workers=0 runs every game in this process, which is handy for
+        # debugging; by default there is one worker per core
+        if workers is None:
+            workers = os.cpu_count() or 1
+        self.num_envs = num_envs
+        self.workers = min(workers, num_envs)
+        self.shm = shared_memory.SharedMemory(create=True, size=buffer_size(num_envs))
+        self.arrays = attach(self.shm.buf, num_envs)
+        self.closed = False
+        self.waiting = False
+        self.local = None
+        self.conns = []
+        self.processes = []
+
+        if self.workers == 0:
+            self.local = EnvShard(0, num_envs, self.arrays, seed)
+            return
+        for start, stop in shard_bounds(num_envs, self.workers):
+            parent, child = multiprocessing.Pipe()
+            process = multiprocessing.Process(target=worker, daemon=True,
+                                              args=(child, self.shm.name, num_envs, start, stop, seed))
+            process.start()
+            child.close()
+            self.conns.append(parent)
+            self.processes.append(process)
+
+    def broadcast(self, command):
+        if self.local is not None:
+            getattr(self.local, command)()
+            return
+        for conn in self.conns:
+            conn.send(command)
+
+    def wait(self):
+        for conn in self.conns:
+            conn.recv()
+
+    def reset(self):
+        self.broadcast("reset")
+        self.wait()
+        return self.arrays["obs"].copy()
+
+    def step_async(self, actions):
+        self.arrays["actions"][:] = actions
+        self.broadcast("step")
+        self.waiting = True
+
+    def step_wait(self):
+        self.wait()
+        self.waiting = False
+        arrays = self.arrays
+        dones = arrays["dones"].copy()
+        infos = [{} for _ in range(self.num_envs)]
+        for i in np.flatnonzero(dones):
+            infos[i] = {"score": int(arrays["final_scores"][i]), "level": int(arrays["final_levels"][i]),
+                        "won": bool(arrays["final_won"][i])}
+        return arrays["obs"].copy(), arrays["rewards"].copy(), dones, infos
+
+    def step(self, actions):
+        self.step_async(actions)
+        return self.step_wait()
+
+    def close(self):
+        if getattr(self, "closed", True):
+            return
+        self.closed = True
+        if self.waiting:
+            self.wait()
+        for conn in self.conns:
+            conn.send("close")
+        for process in self.processes:
+            process.join(timeout=5)
+            if process.is_alive():
+                process.terminate()
+        for conn in self.conns:
+            conn.close()
+        self.local = None
+        self.arrays = None
+        self.shm.close()
+        self.shm.unlink()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        self.close()
+
+    def __del__(self):
+        self.close()
+
+def parse_args(argv=None):
+    parser = argparse.ArgumentParser(description="Throughput test for the vectorised Star Collector environments")
+    parser.add_argument("--envs", type=int, default=64)
+    parser.add_argument("--workers", type=int, help="worker processes (default: one per core, 0 runs in-process)")
+    parser.add_argument("--steps", type=int, default=2000)
+    parser.add_argument("--seed", type=int, default=0)
+    return parser.parse_args(argv)
+
+def main(argv=None):
+    # Random actions, reporting aggregate environment steps per second
+    args = parse_args(argv)
+    rng = np.random.default_rng(args.seed)
+    with VecEnv(args.envs, args.workers, args.seed) as env:
+        env.reset()
+        episodes = 0
+        start = time.perf_counter()
+        for _ in range(args.steps):
+            obs, rewards, dones, infos = env.step(rng.integers(0, NUM_ACTIONS, args.envs))
+            episodes += int(dones.sum())
+        elapsed = time.perf_counter() - start
+        steps = args.envs * args.steps
+        print(f"envs: {args.envs}  workers: {env.workers}  steps: {steps}  time: {elapsed:.3f}s  "
+              f"steps/s: {steps / max(elapsed, 1e-9):.0f}  episodes: {episodes}")
+    return 0
+
+if __name__ == "__main__":
+    sys.exit(main())